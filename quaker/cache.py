@@ -0,0 +1,398 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import contextlib
+import functools
+import threading
+
+from oslo.config import cfg
+from payload.cache import api
+
+from quaker import coalesce
+from quaker import hashring
+from quaker import lru
+from quaker import metrics
+from quaker.openstack.common import log as logging
+
+try:
+    from payload.common import exception as payload_exception
+except ImportError:
+    payload_exception = None
+
+OPTS = [
+    cfg.BoolOpt(
+        'batch_writes', default=True,
+        help='Send all cache writes made while handling an AMI event in a '
+        'single pipelined round trip.'),
+    cfg.IntOpt(
+        'negative_cache_size', default=4096,
+        help='Maximum number of missing queue callers and members '
+        'remembered.'),
+    cfg.IntOpt(
+        'negative_cache_ttl', default=5,
+        help='Seconds a missing queue caller or member is remembered.'),
+    cfg.ListOpt(
+        'cache_nodes', default=[],
+        help='Redis nodes, as host:port, queue callers and members are '
+        'sharded across by queue id. When empty the single node set by the '
+        'payload host and port options is used.'),
+    cfg.IntOpt(
+        'cache_pool_size', default=4,
+        help='Maximum number of connections open to each cache node.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(OPTS)
+LOG = logging.getLogger(__name__)
+
+MUTATIONS = frozenset([
+    'create_queue_caller',
+    'create_queue_member',
+    'delete_queue_caller',
+    'delete_queue_member',
+    'update_queue_caller',
+    'update_queue_member',
+])
+
+QUEUE_METHODS = MUTATIONS | frozenset([
+    'get_queue_caller',
+    'get_queue_member',
+    'list_queue_callers',
+])
+
+# NOTE: What the backend raises for a caller or member it does not hold.
+# Any other error, such as a lost connection, must not be remembered as
+# missing.
+NOT_FOUND = (LookupError,)
+if hasattr(payload_exception, 'NotFound'):
+    NOT_FOUND += (payload_exception.NotFound,)
+
+_CONNECT_LOCK = threading.Lock()
+_NOT_ATOMIC = []
+
+
+def _queue_id(args, kwargs):
+    return args[0] if args else kwargs['queue_id']
+
+
+def _lookup(conn, key):
+    kind, queue_id, uuid = key
+    try:
+        return getattr(conn, 'get_queue_%s' % kind)(
+            queue_id=queue_id, uuid=uuid)
+    except NOT_FOUND:
+        return None
+
+
+def _warn_not_atomic():
+    if not _NOT_ATOMIC:
+        _NOT_ATOMIC.append(True)
+        LOG.warning('The cache backend has no pipeline, transactions are '
+                    'written one write at a time and are not atomic')
+
+
+class Batch(object):
+    """Gather cache writes and send them in one round trip.
+
+    Reads are passed straight through to the :class:`Connection`, writes
+    are queued until the batch is committed. Backends exposing
+    ``pipeline()`` receive every queued write in a single pipelined (or
+    MULTI/EXEC when ``transaction`` is set) request; other backends replay
+    them in order, so a transaction is not atomic there and a warning is
+    logged once. Queue member updates go to the connection's coalescer, when
+    it has one, unless ``hold`` is False.
+    """
+
+    def __init__(self, conn, transaction=False, enabled=True, hold=True):
+        self.conn = conn
+        self.transaction = transaction
+        self.enabled = enabled
+        self.hold = hold
+        self.ops = []
+
+    def __getattr__(self, name):
+        if name in MUTATIONS:
+            return functools.partial(self._queue, name)
+        return getattr(self.conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.ops = []
+
+    def _queue(self, method, *args, **kwargs):
+        if not self.enabled:
+            return self.conn._write(method, *args, hold=self.hold, **kwargs)
+        self.ops.append((method, args, kwargs))
+
+    def commit(self):
+        ops, self.ops = self.ops, []
+        if self.hold and self.conn.coalescer is not None:
+            ops = self.conn.coalescer.absorb(ops)
+        if not ops:
+            return
+
+        pipeline = getattr(self.conn, 'pipeline', None)
+        if pipeline is None:
+            if self.transaction:
+                _warn_not_atomic()
+            for name, args, kwargs in ops:
+                self.conn._write(name, *args, hold=False, **kwargs)
+            return
+
+        with pipeline(transaction=self.transaction) as pipe:
+            for name, args, kwargs in ops:
+                getattr(pipe, name)(*args, **kwargs)
+
+        for name, args, kwargs in ops:
+            self.conn.written(name, args, kwargs)
+
+
+class Connection(object):
+    """Quaker's view of the payload cache.
+
+    Lookups return ``None`` for callers and members that do not exist, and
+    remember the miss for ``negative_cache_ttl`` seconds so repeated events
+    for the same unknown entity never reach the backend.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.coalescer = None
+        self.missing = lru.LRUCache(
+            CONF.negative_cache_size, ttl=CONF.negative_cache_ttl)
+
+    def __getattr__(self, name):
+        if name in MUTATIONS:
+            return functools.partial(self._write, name)
+        return getattr(self.conn, name)
+
+    def _get(self, kind, queue_id, uuid):
+        return self.get_many([(kind, queue_id, uuid)])[0]
+
+    def get_many(self, keys):
+        """Look up ``(kind, queue_id, uuid)`` keys in one backend call.
+
+        Backends offering ``get_many`` receive every key not known to be
+        missing at once, others are asked key by key.
+        """
+        wanted = [key for key in set(keys) if key not in self.missing]
+        found = {}
+        if wanted:
+            metrics.incr('cache.lookups', len(wanted))
+            get_many = getattr(self.conn, 'get_many', None)
+            if get_many is not None:
+                found = dict(zip(wanted, get_many(wanted)))
+            else:
+                found = dict((key, _lookup(self.conn, key)) for key in wanted)
+        for key in wanted:
+            if found[key] is None:
+                self.missing.set(key, True)
+
+        return [found.get(key) for key in keys]
+
+    def _write(self, method, *args, **kwargs):
+        hold = kwargs.pop('hold', True)
+        if hold and self.coalescer is not None:
+            if not self.coalescer.absorb([(method, args, kwargs)]):
+                return None
+        res = getattr(self.conn, method)(*args, **kwargs)
+        self.written(method, args, kwargs)
+
+        return res
+
+    def written(self, method, args, kwargs):
+        """Keep the negative cache in line with a write."""
+        action, kind = method.split('_queue_')
+        key = (kind, _queue_id(args, kwargs), kwargs['uuid'])
+        if action == 'delete':
+            self.missing.set(key, True)
+        else:
+            self.missing.pop(key)
+
+    def get_queue_caller(self, queue_id, uuid):
+        return self._get('caller', queue_id, uuid)
+
+    def get_queue_member(self, queue_id, uuid):
+        return self._get('member', queue_id, uuid)
+
+    def batch(self, transaction=False, hold=True):
+        # NOTE: transactional batches must never be split into separate
+        # writes, whatever batch_writes says.
+        return Batch(
+            self, transaction=transaction,
+            enabled=transaction or CONF.batch_writes, hold=hold)
+
+
+class Pool(object):
+    """Connections to one cache node, opened on demand up to ``size``."""
+
+    def __init__(self, factory, size=None):
+        self.factory = factory
+        self.size = size or CONF.cache_pool_size
+        self.idle = []
+        self.created = 0
+        self._cond = threading.Condition()
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = None
+        with self._cond:
+            while not self.idle and self.created >= self.size:
+                self._cond.wait()
+            if self.idle:
+                conn = self.idle.pop()
+            else:
+                self.created += 1
+
+        if conn is None:
+            try:
+                conn = self.factory()
+            except Exception:
+                with self._cond:
+                    self.created -= 1
+                    self._cond.notify()
+                raise
+
+        try:
+            yield conn
+        finally:
+            with self._cond:
+                self.idle.append(conn)
+                self._cond.notify()
+
+
+class _Pipeline(object):
+
+    def __init__(self):
+        self.ops = []
+
+    def __getattr__(self, name):
+        if name not in MUTATIONS:
+            raise AttributeError(name)
+        return functools.partial(self._queue, name)
+
+    def _queue(self, method, *args, **kwargs):
+        self.ops.append((method, args, kwargs))
+
+
+class Sharded(object):
+    """The payload cache API spread over several nodes by queue id.
+
+    Callers and members live on the node owning their queue id on a
+    consistent hash ring, so adding a node only moves the queues it takes
+    over; ``quaker-rebalance`` copies them across. Pipelines are split into
+    one pipeline per node, a transaction must stay on a single node.
+    """
+
+    def __init__(self, pools):
+        self.pools = pools
+        self.ring = hashring.HashRing(sorted(pools))
+
+    def node(self, queue_id):
+        return self.ring.get_node(queue_id)
+
+    def __getattr__(self, name):
+        if name not in QUEUE_METHODS:
+            raise AttributeError(name)
+        return functools.partial(self._call, name)
+
+    def _call(self, method, *args, **kwargs):
+        pool = self.pools[self.node(_queue_id(args, kwargs))]
+        with pool.connection() as conn:
+            return getattr(conn, method)(*args, **kwargs)
+
+    def get_many(self, keys):
+        """Look up keys with one pooled connection per node."""
+        nodes = collections.OrderedDict()
+        for key in keys:
+            nodes.setdefault(self.node(key[1]), []).append(key)
+
+        found = {}
+        for node, node_keys in nodes.items():
+            with self.pools[node].connection() as conn:
+                for key in node_keys:
+                    found[key] = _lookup(conn, key)
+
+        return [found[key] for key in keys]
+
+    @contextlib.contextmanager
+    def pipeline(self, transaction=False):
+        pipe = _Pipeline()
+        yield pipe
+
+        nodes = collections.OrderedDict()
+        for op in pipe.ops:
+            node = self.node(_queue_id(op[1], op[2]))
+            nodes.setdefault(node, []).append(op)
+        if transaction and len(nodes) > 1:
+            raise ValueError('A cache transaction cannot span cache nodes')
+
+        for node, ops in nodes.items():
+            with self.pools[node].connection() as conn:
+                pipeline = getattr(conn, 'pipeline', None)
+                if pipeline is None:
+                    if transaction:
+                        _warn_not_atomic()
+                    for name, args, kwargs in ops:
+                        getattr(conn, name)(*args, **kwargs)
+                    continue
+                with pipeline(transaction=transaction) as node_pipe:
+                    for name, args, kwargs in ops:
+                        getattr(node_pipe, name)(*args, **kwargs)
+
+
+def connect(host, port):
+    """Open a payload cache connection to the node at ``host`` and ``port``.
+
+    This is the factory each node's :class:`Pool` opens connections with.
+    The payload API only connects where its host and port options point, so
+    they are overridden for the call.
+    """
+    with _CONNECT_LOCK:
+        CONF.set_override('host', host)
+        CONF.set_override('port', port)
+        try:
+            return api.get_instance()
+        finally:
+            CONF.clear_override('host')
+            CONF.clear_override('port')
+
+
+def get_sharded(nodes, factory=connect):
+    """Shard across ``nodes``, given as ``host:port``.
+
+    Connections to each node are opened by calling ``factory`` with its host
+    and port.
+    """
+    pools = {}
+    for node in nodes:
+        host, _, port = node.rpartition(':')
+        pools[node] = Pool(functools.partial(factory, host, int(port)))
+
+    return Sharded(pools)
+
+
+def get_instance():
+    if CONF.cache_nodes:
+        conn = Connection(get_sharded(CONF.cache_nodes))
+    else:
+        conn = Connection(api.get_instance())
+    if CONF.member_update_tick:
+        conn.coalescer = coalesce.Coalescer(conn)
+
+    return conn
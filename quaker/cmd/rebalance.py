@@ -0,0 +1,99 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Move queues to the cache node owning them after cache_nodes changed.
+
+Run it with quaker-server stopped, passing the previous node list and the
+ids of the queues to check. The callers and members of every queue whose
+owner changed are copied to the new node, then deleted from the old one.
+"""
+
+import sys
+
+from oslo.config import cfg
+
+from quaker import cache
+from quaker import config
+
+CLI_OPTS = [
+    cfg.ListOpt(
+        'previous_cache_nodes', default=[],
+        help='Cache nodes queues were sharded across before cache_nodes '
+        'changed.'),
+    cfg.BoolOpt(
+        'dry_run', default=False,
+        help='Only list the queues that would move.'),
+    cfg.MultiStrOpt(
+        'queues', positional=True,
+        help='Ids of the queues to rebalance.'),
+]
+
+CONF = cfg.CONF
+CONF.register_cli_opts(CLI_OPTS)
+
+
+def move_queue(source, target, queue_id):
+    """Copy the callers and members of a queue, then delete the originals."""
+    callers = sorted(
+        source.list_queue_callers(queue_id),
+        key=lambda caller: caller.position)
+    members = source.list_queue_members(queue_id)
+
+    for caller in callers:
+        target.create_queue_caller(
+            queue_id, uuid=caller.uuid, name=caller.name,
+            number=caller.number, status=caller.status)
+    for member in members:
+        target.create_queue_member(
+            queue_id, uuid=member.uuid, number=member.number,
+            status=member.status)
+        if getattr(member, 'paused', None):
+            target.update_queue_member(
+                queue_id=queue_id, uuid=member.uuid, paused=member.paused)
+
+    for caller in callers:
+        source.delete_queue_caller(queue_id, uuid=caller.uuid)
+    for member in members:
+        source.delete_queue_member(queue_id, uuid=member.uuid)
+
+
+def rebalance(previous, current, queues, dry_run=False):
+    """Move every queue whose owner differs between two sharded caches.
+
+    Returns the ``(queue_id, previous_node, node)`` of each moved queue.
+    """
+    moved = []
+    for queue_id in queues:
+        source, target = previous.node(queue_id), current.node(queue_id)
+        if source == target:
+            continue
+        moved.append((queue_id, source, target))
+        if dry_run:
+            continue
+        with previous.pools[source].connection() as src:
+            with current.pools[target].connection() as dst:
+                move_queue(src, dst, queue_id)
+
+    return moved
+
+
+def main():
+    config.parse_args(sys.argv)
+    if not CONF.previous_cache_nodes or not CONF.cache_nodes:
+        sys.exit('Both previous_cache_nodes and cache_nodes must be set')
+
+    moved = rebalance(
+        cache.get_sharded(CONF.previous_cache_nodes),
+        cache.get_sharded(CONF.cache_nodes), CONF.queues or [],
+        dry_run=CONF.dry_run)
+    for queue_id, source, target in moved:
+        print('%s: %s -> %s' % (queue_id, source, target))
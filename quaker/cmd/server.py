@@ -13,15 +13,37 @@
 import sys
 
 import eventlet
-eventlet.monkey_patch(socket=True, select=True, thread=True)
 
 from quaker import config
+from quaker import engine
 from quaker import monitor
 from quaker.openstack.common import log as logging
+from quaker import shard
+
+
+def _run_worker(index, channel):
+    # NOTE: Every worker needs files of its own.
+    for name in ('notification_spool_path', 'snapshot_path'):
+        path = monitor.CONF[name]
+        if path:
+            monitor.CONF.set_override(name, '%s.%d' % (path, index))
+    monitor.Monitor().run(channel)
+
+
+def _run_front(router):
+    monitor.Front(router).run()
 
 
 def main():
     config.parse_args(sys.argv)
+    if engine.CONF.engine not in engine.ENGINES:
+        sys.exit('Unknown engine %s, expected one of: %s' % (
+            engine.CONF.engine, ', '.join(engine.ENGINES)))
+    if not engine.is_async():
+        eventlet.monkey_patch(socket=True, select=True, thread=True)
     logging.setup('quaker')
+    if shard.CONF.shard_workers:
+        shard.serve(_run_worker, _run_front)
+        return
     srv = monitor.Monitor()
     srv.run()
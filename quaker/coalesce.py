@@ -0,0 +1,105 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Merge bursts of queue member updates into a single write.
+
+Ring-all queues and agents toggling pause update the same member many times
+within milliseconds. Updates are held for ``member_update_tick`` seconds and
+merged per (queue, member), then the final state of every member is written
+in one batch. Held updates leave the transaction of the transition that made
+them, so other readers may see a member up to one tick late.
+"""
+
+import collections
+import threading
+
+from oslo.config import cfg
+
+from quaker import engine
+from quaker import metrics
+from quaker.openstack.common import log as logging
+
+OPTS = [
+    cfg.FloatOpt(
+        'member_update_tick', default=0,
+        help='Seconds queue member updates are held and merged before only '
+        'the final state is written, 0 to write every update.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(OPTS)
+LOG = logging.getLogger(__name__)
+
+
+class Coalescer(object):
+
+    def __init__(self, conn, tick=None, listener=None):
+        self.conn = conn
+        self.tick = tick or CONF.member_update_tick
+        self.listener = listener
+        self.pending = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._periodic = engine.Periodic(
+            self._flush, self.tick, channel='cache')
+
+        metrics.gauge('coalesce.pending', lambda: len(self.pending))
+
+    def absorb(self, ops):
+        """Hold the member updates of ``ops``, returning the other writes."""
+        res = []
+        with self._lock:
+            for op in ops:
+                method, args, kwargs = op
+                if method not in ('update_queue_member',
+                                  'delete_queue_member'):
+                    res.append(op)
+                    continue
+
+                kwargs = dict(kwargs)
+                queue_id = args[0] if args else kwargs.pop('queue_id')
+                key = (queue_id, kwargs.pop('uuid'))
+                if method == 'delete_queue_member':
+                    self.pending.pop(key, None)
+                    res.append(op)
+                    continue
+
+                metrics.incr('coalesce.updates')
+                self.pending.setdefault(key, {}).update(kwargs)
+                if self.listener is not None:
+                    self.listener(key[0], key[1], kwargs)
+
+        return res
+
+    def flush(self):
+        with self._lock:
+            pending, self.pending = self.pending, collections.OrderedDict()
+        if not pending:
+            return
+
+        with self.conn.batch(hold=False) as batch:
+            for (queue_id, uuid), fields in pending.items():
+                batch.update_queue_member(
+                    queue_id=queue_id, uuid=uuid, **fields)
+        metrics.incr('coalesce.writes', len(pending))
+
+    def start(self):
+        self._periodic.start()
+
+    def stop(self):
+        self._periodic.stop()
+        self.flush()
+
+    def _flush(self):
+        try:
+            self.flush()
+        except Exception:
+            LOG.exception('Failed to write queue member updates')
@@ -0,0 +1,46 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Decoders for the AMI headers quaker reads on every event."""
+
+import re
+
+from six import moves
+
+_MEMBER_NUMBER_RE = re.compile(r'\d+')
+
+_KEYS = {}
+
+
+def decode_variables(variables):
+    """Return the QUAKER_ variables of an AMI ``Variable`` header.
+
+    Keys lose their QUAKER_ prefix and are lower cased, so
+    ``QUAKER_CALLER_ID=1234`` becomes ``{'caller_id': '1234'}``. Only the
+    QUAKER_ variables are split out, and their keys are interned once.
+    """
+    res = {}
+    keys = _KEYS
+    for var in (',' + variables).split(',QUAKER_')[1:]:
+        name, _, value = var.partition('=')
+        key = keys.get(name)
+        if key is None:
+            key = keys[name] = moves.intern(name.lower())
+        comma = value.find(',')
+        res[key] = value if comma < 0 else value[:comma]
+
+    return res
+
+
+def member_number(interface):
+    """Return the number of an interface such as ``SIP/1001@default``."""
+    return _MEMBER_NUMBER_RE.search(interface).group()
@@ -0,0 +1,90 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Drop AMI events replayed after a reconnect or a failover."""
+
+import sys
+
+from oslo.config import cfg
+
+from quaker import lru
+from quaker import metrics
+
+OPTS = [
+    cfg.ListOpt(
+        'dedup_events', default=['AgentConnect', 'AgentComplete'],
+        help='AMI events only handled once per uniqueid and member.'),
+    cfg.IntOpt(
+        'dedup_size', default=16384,
+        help='Maximum number of AMI events remembered to spot duplicates, '
+        '0 to disable.'),
+    cfg.IntOpt(
+        'dedup_ttl', default=3600,
+        help='Seconds an AMI event is remembered to spot duplicates.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(OPTS)
+
+
+class Deduplicator(object):
+    """Remember recent events by event type, uniqueid and member.
+
+    Lookups and inserts are O(1) on a bounded LRU, so memory stays fixed
+    whatever the event rate. Events without a uniqueid are never dropped.
+    """
+
+    def __init__(self, events=None, size=None, ttl=None):
+        self.events = frozenset(
+            CONF.dedup_events if events is None else events)
+        self.seen = lru.LRUCache(
+            size or CONF.dedup_size,
+            ttl=CONF.dedup_ttl if ttl is None else ttl)
+        self.checked = 0
+        self.hits = 0
+
+        metrics.gauge('dedup.entries', lambda: len(self.seen))
+        metrics.gauge('dedup.hit_rate', self.hit_rate)
+        metrics.gauge('dedup.bytes', self.footprint)
+
+    def key(self, data):
+        if data.get('event') not in self.events or 'uniqueid' not in data:
+            return None
+
+        return (data['event'], data['uniqueid'],
+                data.get('membername') or data.get('agentname'))
+
+    def seen_before(self, data):
+        key = self.key(data)
+        if key is None:
+            return False
+
+        self.checked += 1
+        if key in self.seen:
+            self.hits += 1
+            metrics.incr('dedup.hits')
+            return True
+        self.seen.set(key, True)
+
+        return False
+
+    def hit_rate(self):
+        return float(self.hits) / self.checked if self.checked else 0.0
+
+    def footprint(self):
+        """Approximate bytes used by the remembered events."""
+        res = sys.getsizeof(self.seen)
+        for key in self.seen.keys():
+            res += sys.getsizeof(key) + sum(sys.getsizeof(part)
+                                            for part in key)
+
+        return res
@@ -0,0 +1,284 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Dispatch AMI events from the reader to a pool of handler workers."""
+
+import collections
+import threading
+import time
+
+from oslo.config import cfg
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado import locks
+
+from quaker import engine
+from quaker import metrics
+from quaker.openstack.common import log as logging
+
+OPTS = [
+    cfg.IntOpt(
+        'dispatch_workers', default=1,
+        help='Number of workers running AMI event handlers. The monitor '
+        'only supports 1: agent events write both a caller and a member, '
+        'which no single dispatch key keeps in order across workers.'),
+    cfg.IntOpt(
+        'dispatch_queue_size', default=10000,
+        help='Maximum number of AMI events waiting for a worker.'),
+    cfg.StrOpt(
+        'dispatch_overflow', default='block',
+        help='What to do with an AMI event when the dispatch queue is full: '
+        '"block" stops reading AMI until a worker catches up, "drop-oldest" '
+        'discards the oldest event of the busiest lane, "drop-newest" '
+        'discards the new one.'),
+    cfg.DictOpt(
+        'dispatch_queue_weights', default={},
+        help='Number of events handled from an Asterisk queue before the '
+        'next queue gets a turn, as queue:weight pairs. Queues not listed '
+        'have a weight of 1.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(OPTS)
+LOG = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('block', 'drop-oldest', 'drop-newest')
+
+
+class Lane(object):
+    """Events waiting for one worker, grouped by Asterisk queue.
+
+    Queues are served weighted round robin so one busy queue cannot starve
+    the others; events of a queue keep their order. Events sharing a key
+    may name different queues, so while a key has events waiting, its new
+    events join the queue already holding them and keep their order too.
+    """
+
+    def __init__(self, weights=None):
+        self.weights = weights or {}
+        self.queues = collections.OrderedDict()
+        self.pinned = {}
+        self.credit = 0
+        self.depth = 0
+
+    def __len__(self):
+        return self.depth
+
+    def append(self, queue, item, key=None):
+        if key is not None:
+            queue, count = self.pinned.get(key, (queue, 0))
+            self.pinned[key] = (queue, count + 1)
+        self.queues.setdefault(queue, collections.deque()).append(
+            (key, item))
+        self.depth += 1
+
+    def popleft(self, queue=None):
+        """Pop the next event, or the oldest of ``queue``."""
+        head = next(iter(self.queues))
+        if queue is None:
+            queue = head
+        items = self.queues[queue]
+        key, item = items.popleft()
+        self.depth -= 1
+        if key is not None:
+            count = self.pinned.pop(key)[1] - 1
+            if count:
+                self.pinned[key] = (queue, count)
+
+        if not items:
+            del self.queues[queue]
+            if queue == head:
+                self.credit = 0
+        elif queue == head:
+            self.credit += 1
+            if self.credit >= int(self.weights.get(queue, 1)):
+                self.queues[queue] = self.queues.pop(queue)
+                self.credit = 0
+
+        return item
+
+    def items(self, queue):
+        return [item for _, item in self.queues.get(queue, ())]
+
+    def busiest(self):
+        return max(self.queues, key=lambda queue: len(self.queues[queue]))
+
+    def oldest(self, queue):
+        items = self.queues.get(queue)
+        return items[0][1][2] if items else None
+
+
+class Dispatcher(object):
+    """Run event handlers on a pool of workers fed by a bounded queue.
+
+    Each worker owns a :class:`Lane` and events are hashed to lanes by key,
+    so events sharing a key are handled strictly in order while unrelated
+    events run concurrently. With the legacy engine workers are (green)
+    threads, so ``block`` holds the AMI reader until a worker frees a slot.
+    The async engine cannot stall its own IOLoop, so there ``block`` falls
+    back to ``drop-newest``.
+    """
+
+    def __init__(self, workers=None, size=None, overflow=None):
+        self.workers = workers or CONF.dispatch_workers
+        self.size = size or CONF.dispatch_queue_size
+        self.overflow = overflow or CONF.dispatch_overflow
+        if self.overflow not in OVERFLOW_POLICIES:
+            raise ValueError('Unknown dispatch overflow policy %s' %
+                             self.overflow)
+        if self.overflow == 'block' and engine.is_async():
+            LOG.warning('The async engine cannot block on a full dispatch '
+                        'queue, dropping the newest event instead')
+            self.overflow = 'drop-newest'
+
+        weights = CONF.dispatch_queue_weights
+        self.lanes = [Lane(weights) for _ in range(self.workers)]
+        self.known = set()
+        self.depth = 0
+        self.active = 0
+        self.running = False
+        self._lock = threading.Lock()
+        self._not_empty = [
+            threading.Condition(self._lock) for _ in range(self.workers)]
+        self._not_full = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._ready = None
+
+        metrics.gauge('dispatch.queue.depth', lambda: self.depth)
+        metrics.gauge('dispatch.active', lambda: self.active)
+
+    def start(self):
+        self.running = True
+        if engine.is_async():
+            self._ready = [locks.Condition() for _ in range(self.workers)]
+            for lane in range(self.workers):
+                IOLoop.instance().add_callback(self._work_async, lane)
+            return
+
+        for lane in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(lane,))
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        with self._lock:
+            self.running = False
+            for cond in self._not_empty:
+                cond.notify_all()
+            self._not_full.notify_all()
+        for cond in self._ready or []:
+            cond.notify_all()
+
+    def full(self):
+        return self.depth >= self.size
+
+    def lane(self, key):
+        return hash(key) % self.workers
+
+    def lag(self, queue):
+        """Seconds the oldest waiting event of ``queue`` has waited."""
+        oldest = [lane.oldest(queue) for lane in self.lanes]
+        oldest = [ts for ts in oldest if ts is not None]
+
+        return time.time() - min(oldest) if oldest else 0
+
+    def put(self, handler, data, key=None, queue=None):
+        lane = self.lane(key)
+        if queue not in self.known:
+            self.known.add(queue)
+            metrics.gauge('dispatch.lag.%s' % queue,
+                          lambda: self.lag(queue))
+        with self._lock:
+            while self.full():
+                if self.overflow == 'block' and self.running:
+                    self._not_full.wait()
+                    continue
+
+                metrics.incr('dispatch.dropped')
+                if self.overflow == 'drop-newest':
+                    LOG.warning('Dispatch queue full, dropping %s',
+                                data.get('event'))
+                    return
+                busiest = max(self.lanes, key=len)
+                _, dropped, _ = busiest.popleft(busiest.busiest())
+                self.depth -= 1
+                LOG.warning('Dispatch queue full, dropping %s',
+                            dropped.get('event'))
+
+            self.lanes[lane].append(
+                queue, (handler, data, time.time()), key=key)
+            self.depth += 1
+            self._not_empty[lane].notify()
+        if self._ready is not None:
+            self._ready[lane].notify()
+
+    def _pop(self, lane):
+        self.active += 1
+        self.depth -= 1
+        handler, data, _ = self.lanes[lane].popleft()
+
+        return handler, data
+
+    def _get(self, lane):
+        with self._lock:
+            while self.running and not self.lanes[lane]:
+                self._not_empty[lane].wait()
+            if not self.lanes[lane]:
+                return None
+            item = self._pop(lane)
+            self._not_full.notify()
+            return item
+
+    def _done(self):
+        with self._lock:
+            self.active -= 1
+            metrics.incr('dispatch.handled')
+            if self.idle():
+                self._idle.notify_all()
+
+    def idle(self):
+        return not self.active and not self.depth
+
+    def join(self, timeout=None):
+        """Wait until every queued event has been handled."""
+        with self._lock:
+            if not self.idle():
+                self._idle.wait(timeout)
+
+    def _work(self, lane):
+        while True:
+            item = self._get(lane)
+            if item is None:
+                return
+            handler, data = item
+            try:
+                handler(data).result()
+            except Exception:
+                LOG.exception('Failed to handle %s', data.get('event'))
+            finally:
+                self._done()
+
+    @gen.coroutine
+    def _work_async(self, lane):
+        while self.running:
+            if not self.lanes[lane]:
+                yield self._ready[lane].wait()
+                continue
+
+            with self._lock:
+                handler, data = self._pop(lane)
+            try:
+                yield handler(data)
+            except Exception:
+                LOG.exception('Failed to handle %s', data.get('event'))
+            finally:
+                self._done()
@@ -0,0 +1,136 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Event loop integration for quaker-server.
+
+Handlers are tornado coroutines and reach blocking libraries (the payload
+cache, oslo.messaging) through :func:`submit`. With the ``legacy`` engine the
+call happens inline under eventlet, exactly as before. With the ``async``
+engine it runs on a single-threaded executor per channel, so calls on one
+channel keep their order and the IOLoop itself never blocks.
+"""
+
+import sys
+import threading
+import time
+
+from concurrent import futures
+from oslo.config import cfg
+from tornado import concurrent
+from tornado import ioloop
+
+from quaker.openstack.common import log as logging
+
+OPTS = [
+    cfg.StrOpt(
+        'engine', default='legacy',
+        help='Event loop used by quaker-server. "legacy" monkey patches '
+        'eventlet under the tornado IOLoop, "async" runs AMI reading, cache '
+        'access and notification publishing as coroutines on the IOLoop '
+        'alone.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(OPTS)
+LOG = logging.getLogger(__name__)
+
+ENGINES = ('legacy', 'async')
+
+_EXECUTORS = {}
+
+
+def is_async():
+    return CONF.engine == 'async'
+
+
+def _executor(channel):
+    if channel not in _EXECUTORS:
+        _EXECUTORS[channel] = futures.ThreadPoolExecutor(max_workers=1)
+
+    return _EXECUTORS[channel]
+
+
+def submit(channel, func, *args, **kwargs):
+    """Call ``func`` without blocking the IOLoop, returning a Future."""
+    if is_async():
+        return _executor(channel).submit(func, *args, **kwargs)
+
+    future = concurrent.Future()
+    try:
+        future.set_result(func(*args, **kwargs))
+    except Exception:
+        future.set_exc_info(sys.exc_info())
+
+    return future
+
+
+def call(func, *args, **kwargs):
+    """Submit a cache call."""
+    return submit('cache', func, *args, **kwargs)
+
+
+def shutdown():
+    for executor in _EXECUTORS.values():
+        executor.shutdown()
+    _EXECUTORS.clear()
+
+
+class Periodic(object):
+    """Call ``func`` every ``interval`` seconds until stopped.
+
+    With the legacy engine ``func`` runs on a daemon thread. With the async
+    engine it is scheduled by the IOLoop and submitted to ``channel``, or
+    called on the IOLoop itself when ``channel`` is None.
+    """
+
+    def __init__(self, func, interval, channel=None):
+        self.func = func
+        self.interval = interval
+        self.channel = channel
+        self.running = False
+        self._periodic = None
+
+    def start(self):
+        self.running = True
+        if is_async():
+            self._periodic = ioloop.PeriodicCallback(
+                self._tick, self.interval * 1000)
+            self._periodic.start()
+            return
+
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._periodic is not None:
+            self._periodic.stop()
+            self._periodic = None
+
+    def _call(self):
+        try:
+            self.func()
+        except Exception:
+            LOG.exception('Periodic call to %s failed', self.func)
+
+    def _tick(self):
+        if self.channel is None:
+            self._call()
+        else:
+            submit(self.channel, self._call)
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.interval)
+            if self.running:
+                self._call()
@@ -0,0 +1,65 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Consistent hashing of keys onto a set of nodes.
+
+Each node is placed on the ring ``replicas`` times, so keys spread evenly and
+adding or removing a node only moves the keys of that node.
+"""
+
+import bisect
+import hashlib
+import struct
+
+import six
+
+_POINT = struct.Struct('!I')
+
+
+def _hash(key):
+    key = six.text_type(key).encode('utf-8')
+    return _POINT.unpack_from(hashlib.md5(key).digest())[0]
+
+
+class HashRing(object):
+
+    def __init__(self, nodes=(), replicas=100):
+        self.replicas = replicas
+        self.nodes = []
+        self._points = []
+        self._owners = {}
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add(self, node):
+        self.nodes.append(node)
+        for replica in range(self.replicas):
+            point = _hash('%s-%d' % (node, replica))
+            bisect.insort(self._points, point)
+            self._owners[point] = node
+
+    def remove(self, node):
+        self.nodes.remove(node)
+        for replica in range(self.replicas):
+            point = _hash('%s-%d' % (node, replica))
+            self._points.remove(point)
+            del self._owners[point]
+
+    def get_node(self, key):
+        if not self._points:
+            raise LookupError('Hash ring has no nodes')
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+
+        return self._owners[self._points[index]]
@@ -0,0 +1,72 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import sys
+import time
+
+
+class LRUCache(object):
+    """A bounded mapping with least recently used and TTL eviction.
+
+    :param maxsize: Maximum number of entries kept.
+    :param ttl: Seconds an entry stays valid after it was set, 0 to disable.
+    """
+
+    def __init__(self, maxsize, ttl=0, timer=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._data = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sys.getsizeof(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key, default=None):
+        try:
+            value, expires = self._data.pop(key)
+        except KeyError:
+            return default
+
+        if expires and expires <= self.timer():
+            return default
+
+        self._data[key] = (value, expires)
+        return value
+
+    def set(self, key, value):
+        expires = self.ttl and self.timer() + self.ttl
+        self._data.pop(key, None)
+        self._data[key] = (value, expires)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        try:
+            return self._data.pop(key)[0]
+        except KeyError:
+            return default
+
+    def clear(self):
+        self._data.clear()
+
+    def keys(self):
+        return list(self._data)
+
+
+_MISSING = object()
@@ -0,0 +1,85 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""In-process counters and gauges, reported periodically to the log."""
+
+import collections
+import time
+
+from oslo.config import cfg
+
+from quaker import engine
+from quaker.openstack.common import log as logging
+
+OPTS = [
+    cfg.IntOpt(
+        'metrics_interval', default=60,
+        help='Seconds between metrics reports in the log, 0 to disable.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(OPTS)
+LOG = logging.getLogger(__name__)
+
+_COUNTERS = collections.defaultdict(int)
+_GAUGES = {}
+
+
+def incr(name, value=1):
+    _COUNTERS[name] += value
+
+
+def gauge(name, func):
+    """Register a callable returning the current value of ``name``."""
+    _GAUGES[name] = func
+
+
+def snapshot():
+    res = dict(_COUNTERS)
+    for name, func in _GAUGES.items():
+        res[name] = func()
+
+    return res
+
+
+class Reporter(object):
+    """Log every metric, with a per second rate for counters."""
+
+    def __init__(self, interval=None, timer=time.time):
+        self.interval = CONF.metrics_interval if interval is None else interval
+        self.timer = timer
+        self._last = ({}, timer())
+        self._periodic = None
+
+    def report(self):
+        counters, then = self._last
+        now = self.timer()
+        elapsed = max(now - then, 1e-9)
+        res = {}
+        for name, value in snapshot().items():
+            if name in _COUNTERS:
+                res[name + '.rate'] = (value - counters.get(name, 0)) / elapsed
+            res[name] = value
+        self._last = (dict(_COUNTERS), now)
+
+        return res
+
+    def start(self):
+        if not self.interval:
+            return
+        self._periodic = engine.Periodic(self._log, self.interval)
+        self._periodic.start()
+
+    def _log(self):
+        res = self.report()
+        LOG.info(' '.join(
+            '%s=%s' % (name, res[name]) for name in sorted(res)))
@@ -0,0 +1,130 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compact records of the callers, members and queues in notifications.
+
+Records use ``__slots__`` and build their payload fragment once. The few
+queues, members and called numbers seen on a server are interned by
+:class:`Fragments`, so every notification about them shares one fragment
+instead of nesting freshly built dicts. Fragments are shared and must never
+be modified.
+"""
+
+from oslo.config import cfg
+
+OPTS = [
+    cfg.IntOpt(
+        'fragment_cache_size', default=4096,
+        help='Maximum number of queue, member and called number payload '
+        'fragments kept for reuse by notifications.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(OPTS)
+
+
+class Called(object):
+    __slots__ = ('number', 'payload')
+
+    def __init__(self, number):
+        self.number = number
+        self.payload = {
+            'number': number,
+        }
+
+
+class Queue(object):
+    __slots__ = ('id', 'name', 'number', 'payload')
+
+    def __init__(self, id, name, number):
+        self.id = id
+        self.name = name
+        self.number = number
+        self.payload = {
+            'id': id,
+            'name': name,
+            'number': number,
+        }
+
+
+class Member(object):
+    __slots__ = ('id', 'name', 'number', 'payload')
+
+    def __init__(self, id, name, number):
+        self.id = id
+        self.name = name
+        self.number = number
+        self.payload = {
+            'id': id,
+            'name': name,
+            'number': number,
+        }
+
+
+class Caller(object):
+    __slots__ = ('uuid', 'created_at', 'name', 'number', 'position',
+                 'queue_id', '_payload')
+
+    def __init__(self, uuid, created_at, name, number, position, queue_id):
+        self.uuid = uuid
+        self.created_at = created_at
+        self.name = name
+        self.number = number
+        self.position = position
+        self.queue_id = queue_id
+        self._payload = None
+
+    @classmethod
+    def from_record(cls, data):
+        return cls(data.uuid, data.created_at, data.name, data.number,
+                   data.position, data.queue_id)
+
+    def move(self, position):
+        self.position = position
+        self._payload = None
+
+    @property
+    def payload(self):
+        # NOTE: Built on first use, callers are often deleted unnotified.
+        if self._payload is None:
+            self._payload = {
+                'uuid': self.uuid,
+                'created_at': self.created_at,
+                'name': self.name,
+                'number': self.number,
+                'position': self.position,
+                'queue_id': self.queue_id,
+            }
+
+        return self._payload
+
+
+class Fragments(dict):
+    """Intern records built by ``factory`` from the same arguments.
+
+    Look records up by their arguments, as in ``queues[id, name, number]``.
+    Hits are plain dict lookups; the bound is kept by forgetting every
+    record once ``maxsize`` is reached, not by LRU bookkeeping.
+    """
+
+    def __init__(self, factory, maxsize=None):
+        super(Fragments, self).__init__()
+        self.factory = factory
+        self.maxsize = maxsize or CONF.fragment_cache_size
+
+    def __missing__(self, key):
+        if len(self) >= self.maxsize:
+            self.clear()
+        args = key if isinstance(key, tuple) else (key,)
+        record = self[key] = self.factory(*args)
+
+        return record
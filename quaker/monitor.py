@@ -10,18 +10,33 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import re
+import signal
+import time
 
 from ami import client
 from oslo.config import cfg
-from payload import messaging
-from payload.cache import api
-from payload.openstack.common import context
+from tornado import gen
 from tornado.ioloop import IOLoop
 
+from quaker import cache
+from quaker import decoder
+from quaker import dedup
+from quaker import dispatch
+from quaker import engine
+from quaker import lru
+from quaker import metrics
+from quaker import models
+from quaker import notifier
 from quaker.openstack.common import log as logging
-
-OPTS = [
+from quaker import positions
+from quaker import protocol
+from quaker import roster
+from quaker import shard
+from quaker import snapshot
+from quaker import state
+from quaker import transitions
+
+SERVER_OPTS = [
     cfg.StrOpt(
         'hostname', default='127.0.0.1',
         help='Hostname of the Asterisk manager interface.'),
@@ -33,119 +48,432 @@ OPTS = [
         help='Password of the Asterisk manager interface.'),
 ]
 
+OPTS = SERVER_OPTS + [
+    cfg.ListOpt(
+        'ami_servers', default=[],
+        help='Names of the Asterisk servers to monitor, each configured '
+        'with hostname, username and password in its own [ami:<name>] '
+        'section. Queue names must be unique across servers. When empty '
+        'the single server set by the options above is monitored.'),
+    cfg.StrOpt(
+        'ami_reader', default='python-ami',
+        help='AMI client used to read events, either "python-ami" or '
+        '"quaker". The quaker reader only parses events with a registered '
+        'handler and stops reading while the dispatch queue is full.'),
+    cfg.IntOpt(
+        'caller_cache_size', default=4096,
+        help='Maximum number of queue callers kept in memory.'),
+    cfg.IntOpt(
+        'caller_cache_ttl', default=600,
+        help='Seconds a queue caller is kept in memory, 0 to disable.'),
+    cfg.ListOpt(
+        'ami_event_mask', default=['agent', 'user'],
+        help='Event classes Asterisk sends once connected, as set with the '
+        'AMI Events action. Leave empty to keep the mask of the manager '
+        'user.'),
+    cfg.ListOpt(
+        'ami_event_filter', default=None,
+        help='Events Asterisk is asked to send through an AMI Filter '
+        'action, all others are filtered out server side. Defaults to the '
+        'events quaker has a handler for, leave empty to disable.'),
+    cfg.BoolOpt(
+        'notify_member_updates', default=False,
+        help='Publish a member.update notification for every queue member '
+        'update held by member_update_tick, including the ones merged '
+        'away before reaching the cache.'),
+]
+
 CONF = cfg.CONF
 CONF.register_opts(OPTS)
 LOG = logging.getLogger(__name__)
 
 
-def _send_notification(event, payload):
-    notification = event.replace(" ", "_")
-    notification = "queue.%s" % notification
-    notifier = messaging.get_notifier(publisher_id='quaker')
-    notifier.info(context.RequestContext(), notification, payload)
+class Endpoint(object):
+    """An Asterisk manager interface the monitor reads events from.
+
+    Events are tagged with the endpoint name before they are dispatched,
+    and the endpoint reports its own event rate and lag: the seconds
+    between reading its last handled event and that event being handled.
+    """
+
+    def __init__(self, name, hostname, username, password):
+        self.name = name
+        self.hostname = hostname
+        self.username = username
+        self.password = password
+        if CONF.ami_reader == 'quaker':
+            self.ami = protocol.AMIClient()
+        else:
+            self.ami = client.AMIClient()
+        self.events = []
+        self.handlers = {}
+        self.lag = 0
+        self._received = 'ami.%s.events' % name
+        self._handled = 'ami.%s.handled' % name
+
+        metrics.gauge('ami.%s.lag' % name, lambda: self.lag)
+
+    def register_event(self, event, handler, dispatch):
+        @gen.coroutine
+        def handle(data):
+            try:
+                yield handler(data)
+            finally:
+                self.lag = time.time() - data['_quaker_received']
+                metrics.incr(self._handled)
+
+        def callback(data):
+            data['_quaker_source'] = self.name
+            data['_quaker_received'] = time.time()
+            metrics.incr(self._received)
+            dispatch(handle, data)
+
+        self.events.append(event)
+        self.handlers[event] = handle
+        self.ami.register_event(event, callback)
+
+    def connect(self):
+        self.ami.connect(
+            hostname=self.hostname, username=self.username,
+            password=self.password, callback=self.on_connect)
+
+    def on_connect(self, data):
+        LOG.info('Connected to AMI %s', self.name)
+        self._set_event_filter()
+
+    def _set_event_filter(self):
+        """Ask Asterisk to only send the events quaker handles."""
+        send_action = getattr(self.ami, 'send_action', None)
+        if send_action is None:
+            LOG.warning('AMI client cannot send actions, all events will be '
+                        'read and filtered by quaker')
+            return
+
+        if CONF.ami_event_mask:
+            send_action('Events', EventMask=','.join(CONF.ami_event_mask))
+        events = CONF.ami_event_filter
+        if events is None:
+            events = self.events
+        if events:
+            send_action('Filter', Operation='Add',
+                        Filter='Event: (%s)' % '|'.join(events))
+
+
+def get_endpoints():
+    if not CONF.ami_servers:
+        return [Endpoint(
+            'default', CONF.hostname, CONF.username, CONF.password)]
+
+    res = []
+    for name in CONF.ami_servers:
+        group = 'ami:%s' % name
+        CONF.register_opts(SERVER_OPTS, group=group)
+        conf = CONF[group]
+        res.append(Endpoint(
+            name, conf.hostname, conf.username, conf.password))
+
+    return res
+
+
+def _stop_on_signals():
+    """Stop the IOLoop on SIGTERM and SIGINT, so shutdown can run."""
+    io_loop = IOLoop.instance()
+
+    def handler(signum, frame):
+        LOG.info('Stopping on signal %d', signum)
+        io_loop.add_callback_from_signal(io_loop.stop)
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, handler)
 
 
 class Monitor(object):
     def __init__(self):
-        self.ami = client.AMIClient()
-        self.ami.register_event('AgentCalled', self._handle_agent_called)
-        self.ami.register_event('AgentComplete', self._handle_agent_complete)
-        self.ami.register_event('AgentConnect', self._handle_agent_connect)
-        self.ami.register_event(
+        # NOTE: Agent events are routed by caller but also write the member
+        # status, so more workers could apply a member's writes out of order.
+        if CONF.dispatch_workers > 1:
+            raise ValueError('quaker-server supports a single dispatch '
+                             'worker, dispatch_workers is %d' %
+                             CONF.dispatch_workers)
+        self.endpoints = get_endpoints()
+        self.dispatcher = dispatch.Dispatcher()
+        self.dedup = dedup.Deduplicator() if CONF.dedup_size else None
+        self._register_events()
+        if CONF.ami_reader == 'quaker':
+            for endpoint in self.endpoints:
+                endpoint.ami.throttle = self.dispatcher.full
+        self.cache = cache.get_instance()
+        if self.cache.coalescer is not None and CONF.notify_member_updates:
+            self.cache.coalescer.listener = self._notify_member_update
+        self.state = None
+        self.redis = self.cache
+        if CONF.state_engine:
+            self.state = self.redis = state.State(self.cache)
+        self.transitions = transitions.Engine(self.redis)
+        self.callers = lru.LRUCache(
+            CONF.caller_cache_size, ttl=CONF.caller_cache_ttl)
+        self.called = models.Fragments(models.Called)
+        self.queues = models.Fragments(models.Queue)
+        self.members = models.Fragments(models.Member)
+        self.positions = {}
+        self.restored = {}
+        self.roster = roster.Roster()
+        self.publisher = notifier.Publisher()
+        self.sequence = 0
+        self.snapshots = None
+
+    def _register_events(self):
+        self._register_event('AgentCalled', self._handle_agent_called)
+        self._register_event('AgentComplete', self._handle_agent_complete)
+        self._register_event('AgentConnect', self._handle_agent_connect)
+        self._register_event(
             'QueueMemberAdded', self._handle_queue_member_added)
-        self.ami.register_event(
+        self._register_event(
             'QueueMemberPaused', self._handle_queue_member_paused)
-        self.ami.register_event(
+        self._register_event(
             'QueueMemberRemoved', self._handle_queue_member_removed)
-        self.ami.register_event(
+        self._register_event(
             'UserEvent', self._handle_user_event)
-        self.redis = api.get_instance()
-        self.callers = dict()
 
-    def on_connect(self, data):
-        LOG.info('Connected to AMI')
+    def _register_event(self, event, handler):
+        for endpoint in self.endpoints:
+            endpoint.register_event(event, handler, self._on_event)
+
+    def _on_event(self, handler, data):
+        if self.dedup is not None and self.dedup.seen_before(data):
+            LOG.warning('Dropping duplicate %s %s from %s', data['event'],
+                        data['uniqueid'], data['_quaker_source'])
+            return
+        self._dispatch(handler, data)
+
+    def _dispatch(self, handler, data):
+        self.sequence += 1
+        key, queue = self._get_event_route(data)
+        self.dispatcher.put(
+            handler, data, key=(data['_quaker_source'], key), queue=queue)
+
+    def _receive(self, data):
+        """Dispatch an event routed here by a sharding front reader."""
+        for endpoint in self.endpoints:
+            if endpoint.name == data['_quaker_source']:
+                self._dispatch(endpoint.handlers[data['event']], data)
+                return
+        LOG.warning('Event from unknown AMI server %s',
+                    data['_quaker_source'])
+
+    def _get_event_route(self, data):
+        """Return the caller (or member) and queue an event is about."""
+        if 'quaker_caller_id' in data:
+            return data['quaker_caller_id'], data['quaker_queue_name']
+        if 'variable' in data:
+            variables = self._get_quaker_vars(data)
+            return variables.get('caller_id'), variables.get('queue_name')
+
+        return data.get('membername'), data.get('queue')
 
     def process_event(self, data):
         print data
 
-    def _get_quaker_vars(self, variables):
-        res = {}
-        for var in variables.split(','):
-            key, value = var.split('=', 1)
-            if key.startswith('QUAKER_'):
-                res[key[7:].lower()] = value
+    def _publish(self, data, event, json):
+        json['source'] = data.get('_quaker_source')
+        self.publisher.publish(event, json)
 
-        return res
+    def _notify_member_update(self, queue_id, uuid, fields):
+        json = {
+            'queue': self.queues[queue_id, queue_id, None].payload,
+            'member': self.members[uuid, uuid, None].payload,
+            'update': dict(fields),
+        }
+        self.publisher.publish('member.update', json)
+
+    def collect(self):
+        """Return the sequence number and state to snapshot."""
+        callers = []
+        for key in self.callers.keys():
+            caller = self.callers.get(key)
+            if caller is not None:
+                callers.append((
+                    caller.uuid, caller.created_at, caller.name,
+                    caller.number, caller.position, caller.queue_id))
+        queues = dict(
+            (queue_id, index.callers())
+            for queue_id, index in self.positions.items())
+        # NOTE: Queues restored but not seen since are snapshotted as is.
+        for queue_id, (uuids, fields) in list(self.restored.items()):
+            queues.setdefault(queue_id, uuids)
+            callers.extend(fields)
+        state = {
+            'callers': callers,
+            'positions': queues,
+            'roster': self.roster.dump(),
+        }
+
+        return self.sequence, state
+
+    def restore(self, snap):
+        """Warm start from a :class:`snapshot.Snapshot`.
+
+        Events handled after the snapshot was taken reached the cache only,
+        so each queue is checked against it on its first event, when its
+        positions are seeded as on a cold start: callers who left are
+        dropped and those who entered queue up behind.
+        """
+        state = snap.state
+        restored = dict(
+            (queue_id, (uuids, []))
+            for queue_id, uuids in state['positions'].items())
+        for fields in state['callers']:
+            restored.setdefault(fields[5], ([], []))[1].append(fields)
+        self.restored = restored
+        self.roster.restore(state['roster'])
+        self.sequence = snap.sequence
+
+    def member_queues(self, member):
+        """Return the queues ``member`` belongs to."""
+        return self.roster.queues(member)
+
+    @gen.coroutine
+    def _get_positions(self, queue_id):
+        index = self.positions.get(queue_id)
+        if index is not None:
+            raise gen.Return(index)
+
+        # NOTE: Callers who entered before a restart keep their order.
+        callers = yield engine.call(self.redis.list_queue_callers, queue_id)
+        index = self.positions.get(queue_id)
+        if index is None:
+            index = self.positions[queue_id] = self._seed_positions(
+                queue_id, callers)
+
+        raise gen.Return(index)
+
+    def _seed_positions(self, queue_id, callers):
+        live = dict((caller.uuid, caller) for caller in callers)
+        uuids, restored = self.restored.pop(queue_id, ((), ()))
+        index = positions.Index()
+        for uuid in uuids:
+            if uuid in live:
+                index.append(uuid)
+        for caller in sorted(callers, key=lambda c: c.position):
+            if caller.uuid not in index:
+                index.append(caller.uuid)
+
+        for fields in restored:
+            caller = models.Caller(*fields)
+            key = (queue_id, caller.uuid)
+            if caller.uuid in live and self.callers.get(key) is None:
+                caller.move(index.position(caller.uuid))
+                self.callers.set(key, caller)
+
+        return index
+
+    def _move_callers(self, data, queue_id, moved):
+        if not moved:
+            return
+
+        for uuid, position in moved:
+            caller = self.callers.get((queue_id, uuid))
+            if caller is not None:
+                caller.move(position)
+        metrics.incr('positions.moved', len(moved))
 
-    def _get_called(self, variables):
         json = {
-            'number': variables['called_number']
+            'queue': self.queues[queue_id, queue_id, None].payload,
+            'callers': [
+                {'uuid': uuid, 'position': position}
+                for uuid, position in moved],
         }
-        return json
+        self._publish(data, 'caller.positions', json)
+
+    def _get_quaker_vars(self, data):
+        # NOTE: Decoded once per event, when it is routed to a lane.
+        if '_quaker_vars' not in data:
+            data['_quaker_vars'] = decoder.decode_variables(data['variable'])
+
+        return data['_quaker_vars']
+
+    def _get_called(self, variables):
+        return self.called[variables['called_number']].payload
 
+    @gen.coroutine
     def _get_caller(self, variables):
+        key = (variables['queue_name'], variables['caller_id'])
+        caller = self.callers.get(key)
+        if caller is not None:
+            raise gen.Return(caller.payload)
+
+        data = yield self._lookup_caller(
+            variables['queue_name'], variables['caller_id'])
+        if data is not None:
+            caller = self._cache_caller(data)
+        else:
+            caller = models.Caller(
+                variables['caller_id'], None, variables['caller_name'],
+                variables['caller_number'], None, variables['queue_name'])
+        raise gen.Return(caller.payload)
+
+    @gen.coroutine
+    def _lookup_caller(self, queue_id, uuid):
+        # NOTE: Events still get notified when the cache fails, from what
+        # they carry themselves.
         try:
-            data = self.redis.get_queue_caller(
-                queue_id=variables['queue_name'], uuid=variables['caller_id'])
-            json = {
-                'uuid': data.uuid,
-                'created_at': data.created_at,
-                'name': data.name,
-                'number': data.number,
-                'position': data.position,
-                'queue_id': data.queue_id,
-            }
-        except Exception as e:
-            json = {
-                'uuid': variables['caller_id'],
-                'created_at': None,
-                'name': variables['caller_name'],
-                'number': variables['caller_number'],
-                'position': None,
-                'queue_id': variables['queue_name'],
-            }
-        return json
+            data = yield engine.call(
+                self.redis.get_queue_caller, queue_id=queue_id, uuid=uuid)
+        except Exception:
+            LOG.exception('Failed to look up caller %s in %s', uuid, queue_id)
+            data = None
+        raise gen.Return(data)
+
+    def _cache_caller(self, data):
+        caller = models.Caller.from_record(data)
+        self.callers.set((caller.queue_id, caller.uuid), caller)
+
+        return caller
 
     def _get_queue(self, variables):
-        json = {
-            'id': None,
-            'name': variables['queue_name'],
-            'number': variables['queue_number'],
-        }
-        return json
+        return self.queues[
+            None, variables['queue_name'], variables['queue_number']].payload
 
-    def _get_member_number(self, data):
-        res = re.search('\d+(^@)?', data)
+    def _get_member(self, id, name, interface):
+        return self.members[
+            id, name, self._get_member_number(interface)].payload
 
-        return res.group()
+    def _get_member_number(self, data):
+        return decoder.member_number(data)
 
+    @gen.coroutine
     def _get_common_headers(self, data):
         res = {}
         res['called'] = self._get_called(data)
-        res['caller'] = self._get_caller(data)
+        res['caller'] = yield self._get_caller(data)
         res['queue'] = self._get_queue(data)
 
-        return res
+        raise gen.Return(res)
 
     def _handle_user_event(self, data):
         if data['userevent'] == 'QueueMemberCancel':
-            self._handle_queue_member_cancel(data)
+            return self._handle_queue_member_cancel(data)
         elif data['userevent'] == 'QueueCallerCreate':
-            self._handle_queue_caller_create(data)
+            return self._handle_queue_caller_create(data)
         else:
-            self._handle_queue_caller_delete(data)
+            return self._handle_queue_caller_delete(data)
 
+    @gen.coroutine
     def _handle_queue_caller_delete(self, data):
-        try:
-            res = self.redis.get_queue_caller(
-                queue_id=data['quaker_queue_name'],
-                uuid=data['quaker_caller_id'])
+        queue_id = data['quaker_queue_name']
+        self.callers.pop((queue_id, data['quaker_caller_id']))
+        index = yield self._get_positions(queue_id)
+        moved = index.remove(data['quaker_caller_id'])
+        res = yield self._lookup_caller(queue_id, data['quaker_caller_id'])
+        if res is None and not moved:
+            return
 
-            self.redis.delete_queue_caller(
-                res.queue_id, uuid=res.uuid)
-        except Exception as e:
-            pass
+        yield engine.call(
+            self.transitions.apply, 'caller_delete', queue_id=queue_id,
+            caller_uuid=res and res.uuid, moved=moved)
+        self._move_callers(data, queue_id, moved)
 
+    @gen.coroutine
     def _handle_queue_member_cancel(self, data):
         json = {}
         json['caller'] = {
@@ -153,164 +481,247 @@ class Monitor(object):
             'name': None,
             'number': None,
         }
-        json['queue'] = {
-            'id': None,
-            'name': data['quaker_queue_name'],
-            'number': data['quaker_queue_number'],
-        }
-        json['member'] = {
-            'id': None,
-            'name': data['agentname'],
-            'number': self._get_member_number(data['agentname']),
-        }
+        json['queue'] = self.queues[
+            None, data['quaker_queue_name'],
+            data['quaker_queue_number']].payload
+        json['member'] = self._get_member(
+            None, data['agentname'], data['agentname'])
         json['reason'] = '19'
 
-        self.redis.update_queue_member(
-            queue_id=data['quaker_queue_name'],
-            uuid=data['agentname'], status=1)
+        caller = yield self._lookup_caller(
+            data['quaker_queue_name'], data['agentname'])
 
-        try:
-            self.redis.update_queue_caller(
-                queue_id=data['quaker_queue_name'], uuid=data['agentname'],
-                status=1)
-        except Exception as e:
-            pass
+        yield engine.call(
+            self.transitions.apply, 'member_cancel',
+            queue_id=data['quaker_queue_name'],
+            caller_uuid=caller and caller.uuid, member_uuid=data['agentname'])
 
         LOG.info(json)
-        _send_notification('member.cancel', json)
+        self._publish(data, 'member.cancel', json)
 
+    @gen.coroutine
     def _handle_agent_called(self, data):
-        variables = self._get_quaker_vars(data['variable'])
-
-        json = self._get_common_headers(variables)
-        json['member'] = {
-            'id': None,
-            'name': data['agentname'],
-            'number': self._get_member_number(data['agentcalled']),
-        }
+        variables = self._get_quaker_vars(data)
 
-        self.redis.update_queue_caller(
-            queue_id=json['queue']['name'], uuid=json['caller']['uuid'],
-            member_uuid=json['member']['name'], status=2)
+        json = yield self._get_common_headers(variables)
+        json['member'] = self._get_member(
+            None, data['agentname'], data['agentcalled'])
 
-        self.redis.update_queue_member(
-            queue_id=json['queue']['name'], uuid=json['member']['name'],
-            status=6)
+        yield engine.call(
+            self.transitions.apply, 'agent_called',
+            queue_id=json['queue']['name'],
+            caller_uuid=json['caller']['uuid'],
+            member_uuid=json['member']['name'])
 
         LOG.info(json)
-        _send_notification('member.alert', json)
+        self._publish(data, 'member.alert', json)
 
+    @gen.coroutine
     def _handle_agent_complete(self, data):
-        variables = self._get_quaker_vars(data['variable'])
+        variables = self._get_quaker_vars(data)
 
-        json = self._get_common_headers(variables)
+        json = yield self._get_common_headers(variables)
         json['id'] = data['uniqueid']
-        json['member'] = {
-            'id': None,
-            'name': data['membername'],
-            'number': self._get_member_number(data['member']),
-        }
+        json['member'] = self._get_member(
+            None, data['membername'], data['member'])
 
-        self.redis.update_queue_member(
-            queue_id=json['queue']['name'], uuid=json['member']['name'],
-            status=1)
+        yield engine.call(
+            self.transitions.apply, 'agent_complete',
+            queue_id=json['queue']['name'],
+            member_uuid=json['member']['name'])
 
         LOG.info(json)
-        _send_notification('member.complete', json)
+        self._publish(data, 'member.complete', json)
 
+    @gen.coroutine
     def _handle_agent_connect(self, data):
-        variables = self._get_quaker_vars(data['variable'])
+        variables = self._get_quaker_vars(data)
 
-        json = self._get_common_headers(variables)
+        json = yield self._get_common_headers(variables)
         json['id'] = data['uniqueid']
-        json['member'] = {
-            'id': None,
-            'name': data['membername'],
-            'number': self._get_member_number(data['member']),
-        }
-
-        self.redis.update_queue_caller(
-            queue_id=json['queue']['name'], uuid=json['caller']['uuid'],
-            status=3)
-
-        self.redis.delete_queue_caller(
-            json['queue']['name'], uuid=json['caller']['uuid'])
-
-        self.redis.update_queue_member(
-            queue_id=json['queue']['name'], uuid=json['member']['name'],
-            status=2)
+        json['member'] = self._get_member(
+            None, data['membername'], data['member'])
+        queue_id = json['queue']['name']
+        index = yield self._get_positions(queue_id)
+        moved = index.remove(json['caller']['uuid'])
+
+        yield engine.call(
+            self.transitions.apply, 'agent_connect', queue_id=queue_id,
+            caller_uuid=json['caller']['uuid'],
+            member_uuid=json['member']['name'], moved=moved)
+        self.callers.pop((queue_id, json['caller']['uuid']))
 
         LOG.info(json)
-        _send_notification('member.connect', json)
+        self._publish(data, 'member.connect', json)
+        self._move_callers(data, queue_id, moved)
 
+    @gen.coroutine
     def _handle_queue_caller_create(self, data):
-        res = self.redis.create_queue_caller(
-            data['quaker_queue_name'], uuid=data['quaker_caller_id'],
-            name=data['quaker_caller_name'], number=data['quaker_caller_number'],
-            status=1)
-
+        queue_id = data['quaker_queue_name']
+        index = yield self._get_positions(queue_id)
+        # NOTE: A single write, issued directly so the created caller can
+        # seed the in-memory cache.
+        res = yield engine.call(
+            self.redis.create_queue_caller, queue_id,
+            uuid=data['quaker_caller_id'], name=data['quaker_caller_name'],
+            number=data['quaker_caller_number'], status=1)
+        self._cache_caller(res)
+
+        position = index.append(res.uuid)
+        if res.position != position:
+            moved = [(res.uuid, position)]
+            yield engine.call(
+                self.transitions.apply, 'caller_move', queue_id=queue_id,
+                moved=moved)
+            self._move_callers(data, queue_id, moved)
+
+    @gen.coroutine
     def _handle_queue_member_added(self, data):
+        member = data['membername']
         json = {
-            'member': {
-                'id': data['membername'],
-                'name': data['membername'],
-                'number': data['membername'],
-            },
+            'member': self.members[member, member, member].payload,
         }
 
         if data['queue'] == '_CSRs':
+            self.roster.login(member)
             LOG.info(json)
-            _send_notification('member.login', json)
+            self._publish(data, 'member.login', json)
             return
 
-        json['queue'] = {
-            'id': data['queue'],
-            'name': data['queue'],
-            'number': None,
-        }
+        json['queue'] = self.queues[
+            data['queue'], data['queue'], None].payload
+        self.roster.add(member, data['queue'])
 
-        self.redis.create_queue_member(
+        batch = self.redis.batch()
+        batch.create_queue_member(
             queue_id=json['queue']['id'], uuid=json['member']['id'],
             number=json['member']['number'], status=1)
+        yield engine.call(batch.commit)
 
         LOG.info(json)
 
+    @gen.coroutine
     def _handle_queue_member_removed(self, data):
+        member = data['membername']
         json = {
-            'member': {
-                'id': data['membername'],
-                'name': data['membername'],
-                'number': data['membername'],
-            },
+            'member': self.members[member, member, member].payload,
         }
 
         if data['queue'] == '_CSRs':
+            queues = self.roster.queues(member)
+            if queues:
+                yield engine.call(
+                    self.transitions.apply, 'member_logout',
+                    member_uuid=member, queues=queues)
+            # NOTE: Only once deleted may the removals that follow be skipped.
+            self.roster.drop(member, queues)
             LOG.info(json)
-            _send_notification('member.logout', json)
+            self._publish(data, 'member.logout', json)
             return
 
-        json['queue'] = {
-            'id': data['queue'],
-            'name': data['queue'],
-            'number': None,
-        }
+        json['queue'] = self.queues[
+            data['queue'], data['queue'], None].payload
+        if not self.roster.remove(member, data['queue']):
+            metrics.incr('roster.skipped')
+            return
 
-        self.redis.delete_queue_member(
+        batch = self.redis.batch()
+        batch.delete_queue_member(
             queue_id=json['queue']['id'], uuid=json['member']['id'])
+        yield engine.call(batch.commit)
 
         LOG.info(json)
 
+    @gen.coroutine
     def _handle_queue_member_paused(self, data):
         paused = 0
         if 'reason' in data:
             paused = data['reason']
 
-        self.redis.update_queue_member(
-            queue_id=data['queue'], uuid=data['membername'],
-            paused=paused)
+        member = data['membername']
+        if data.get('queue', '_CSRs') == '_CSRs':
+            queues = self.roster.queues(member)
+            if queues:
+                yield engine.call(
+                    self.transitions.apply, 'member_pause',
+                    member_uuid=member, queues=queues, paused=paused)
+            self.roster.pause(member, queues, paused)
+            return
+
+        if not self.roster.pause_queue(member, data['queue'], paused):
+            metrics.incr('roster.skipped')
+            return
+
+        batch = self.redis.batch()
+        batch.update_queue_member(
+            queue_id=data['queue'], uuid=member, paused=paused)
+        yield engine.call(batch.commit)
+
+    def run(self, channel=None):
+        """Handle events read from AMI, or sent over a shard ``channel``."""
+        metrics.Reporter().start()
+        if CONF.snapshot_path:
+            start = time.time()
+            snap = snapshot.load(CONF.snapshot_path)
+            if snap is not None:
+                self.restore(snap)
+                LOG.info('Warm started from event %d in %.3f seconds',
+                         snap.sequence, time.time() - start)
+            self.snapshots = snapshot.Writer(
+                CONF.snapshot_path, self.collect)
+            self.snapshots.start()
+        self.publisher.start()
+        self.dispatcher.start()
+        if self.cache.coalescer is not None:
+            self.cache.coalescer.start()
+        if self.state is not None:
+            self.state.start()
+        if channel is not None:
+            shard.Reader(
+                channel, self._receive,
+                on_close=IOLoop.instance().stop).start()
+        else:
+            for endpoint in self.endpoints:
+                endpoint.connect()
+        _stop_on_signals()
+        try:
+            IOLoop.instance().start()
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Write out everything still held in memory."""
+        stops = [self.dispatcher.stop]
+        if self.state is not None:
+            stops.append(self.state.stop)
+        if self.cache.coalescer is not None:
+            stops.append(self.cache.coalescer.stop)
+        if self.snapshots is not None:
+            stops.append(self.snapshots.stop)
+        stops.append(self.publisher.stop)
+        for stop in stops:
+            try:
+                stop()
+            except Exception:
+                LOG.exception('Failed to shut down cleanly')
+
+
+class Front(Monitor):
+    """Read AMI and route each event to the shard worker of its queue."""
+
+    def __init__(self, router):
+        self.endpoints = get_endpoints()
+        self.router = router
+        self.dedup = dedup.Deduplicator() if CONF.dedup_size else None
+        self._register_events()
+
+    def _dispatch(self, handler, data):
+        _, queue = self._get_event_route(data)
+        self.router.put(data, queue)
 
     def run(self):
-        self.ami.connect(
-            hostname=CONF.hostname, username=CONF.username,
-            password=CONF.password, callback=self.on_connect)
+        metrics.Reporter().start()
+        for endpoint in self.endpoints:
+            endpoint.connect()
+        _stop_on_signals()
         IOLoop.instance().start()
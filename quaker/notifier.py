@@ -0,0 +1,349 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import threading
+import time
+
+from oslo.config import cfg
+from payload import messaging
+from payload.openstack.common import context
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from quaker import engine
+from quaker import lru
+from quaker import metrics
+from quaker.openstack.common import log as logging
+from quaker import spool
+
+OPTS = [
+    cfg.IntOpt(
+        'notification_batch_size', default=100,
+        help='Maximum number of notifications sent per batch.'),
+    cfg.FloatOpt(
+        'notification_max_latency', default=0.5,
+        help='Maximum number of seconds a notification waits for its batch '
+        'to fill up.'),
+    cfg.IntOpt(
+        'notification_buffer_size', default=10000,
+        help='Maximum number of notifications buffered, the oldest are '
+        'dropped once it is full.'),
+    cfg.StrOpt(
+        'notification_spool_path', default=None,
+        help='File notifications are spooled to while the broker is down or '
+        'cannot keep up. Notifications are dropped when unset.'),
+    cfg.FloatOpt(
+        'notification_retry_interval', default=1.0,
+        help='Seconds to wait before resending a notification the broker '
+        'rejected.'),
+    cfg.StrOpt(
+        'notification_mode', default='full',
+        help='"full" sends the whole payload of every notification, '
+        '"delta" only the fields that changed since the previous '
+        'notification about the same queue member, with a version number '
+        'and periodic full snapshots.'),
+    cfg.IntOpt(
+        'notification_snapshot_interval', default=300,
+        help='Seconds between full snapshots of a queue member in delta '
+        'mode.'),
+    cfg.FloatOpt(
+        'notification_coalesce_window', default=0,
+        help='Seconds member.update notifications about the same queue '
+        'member are held, only the last one held is sent. Call lifecycle '
+        'notifications are always sent. 0 to send every notification.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(OPTS)
+
+# NOTE: Only the state of a member flaps, every call must be reported.
+COALESCED = frozenset(['member.update'])
+LOG = logging.getLogger(__name__)
+
+_NOTIFIERS = {}
+
+MODES = ('full', 'delta')
+
+# NOTE: Sections always sent with these fields, so a delta can be matched
+# to its queue member.
+_IDENTITY = {
+    'member': ('name',),
+    'queue': ('name',),
+}
+
+
+def get_notifier(publisher_id='quaker'):
+    if publisher_id not in _NOTIFIERS:
+        _NOTIFIERS[publisher_id] = messaging.get_notifier(
+            publisher_id=publisher_id)
+
+    return _NOTIFIERS[publisher_id]
+
+
+def _member_key(payload):
+    member = payload.get('member')
+    if not isinstance(member, dict):
+        return None
+    queue = payload.get('queue') or {}
+
+    return queue.get('name'), member.get('name')
+
+
+def _diff(old, new):
+    res = {}
+    for name, value in new.items():
+        previous = old.get(name)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            identity = _IDENTITY.get(name, ())
+            changed = dict(
+                (field, field_value) for field, field_value in value.items()
+                if field in identity or previous.get(field) != field_value)
+            if identity or changed:
+                res[name] = changed
+        elif name not in old or previous != value:
+            res[name] = value
+    for name in old:
+        if name not in new:
+            res[name] = None
+
+    return res
+
+
+class DeltaEncoder(object):
+    """Reduce payloads to what changed for their queue member.
+
+    Each queue member gets a version bumped by every notification about it.
+    The first notification, and one every ``snapshot_interval`` seconds, is
+    a full snapshot; the others only carry the fields that changed.
+    """
+
+    max_members = 65536
+
+    def __init__(self, snapshot_interval=None, timer=time.time):
+        self.snapshot_interval = (
+            CONF.notification_snapshot_interval
+            if snapshot_interval is None else snapshot_interval)
+        self.timer = timer
+        self.state = lru.LRUCache(self.max_members)
+
+    def encode(self, payload):
+        key = _member_key(payload)
+        if key is None:
+            return payload
+
+        now = self.timer()
+        state = self.state.get(key)
+        if state is None or now - state[2] >= self.snapshot_interval:
+            version = state[0] + 1 if state is not None else 1
+            self.state.set(key, (version, payload, now))
+            res = dict(payload)
+            res['snapshot'] = True
+        else:
+            version = state[0] + 1
+            self.state.set(key, (version, payload, state[2]))
+            res = _diff(state[1], payload)
+            res['snapshot'] = False
+            metrics.incr('notification.deltas')
+        res['version'] = version
+
+        return res
+
+
+class Publisher(object):
+    """Send notifications in batches from a background worker.
+
+    :meth:`publish` only appends to a bounded buffer, so a slow broker never
+    stalls AMI event processing. With ``notification_spool_path`` set,
+    notifications go to an on-disk spool instead while the buffer is full or
+    the broker is down, and are replayed in order once it is back.
+    Payloads are reduced to deltas with ``notification_mode`` set to
+    ``delta``, and updates of the same queue member are held and merged for
+    ``notification_coalesce_window`` seconds when it is set.
+    """
+
+    def __init__(self, publisher_id='quaker'):
+        self.notifier = get_notifier(publisher_id)
+        self.context = context.RequestContext()
+        self.batch_size = CONF.notification_batch_size
+        self.max_latency = CONF.notification_max_latency
+        self.retry_interval = CONF.notification_retry_interval
+        self.buffer = collections.deque(maxlen=CONF.notification_buffer_size)
+        self.spool = None
+        if CONF.notification_spool_path:
+            self.spool = spool.Spool(CONF.notification_spool_path)
+        if CONF.notification_mode not in MODES:
+            raise ValueError('Unknown notification mode %s' %
+                             CONF.notification_mode)
+        self.deltas = None
+        if CONF.notification_mode == 'delta':
+            self.deltas = DeltaEncoder()
+        self.window = CONF.notification_coalesce_window
+        self.held = collections.OrderedDict()
+        self.broker_down = False
+        self.running = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self._periodic = None
+        if self.window:
+            self._periodic = engine.Periodic(self.release, self.window)
+
+        metrics.gauge('notification.buffer.depth', lambda: len(self.buffer))
+        metrics.gauge('notification.spool.depth', self._spooled)
+
+    def _spooled(self):
+        return len(self.spool) if self.spool is not None else 0
+
+    def start(self):
+        self.running = True
+        if self._periodic is not None:
+            self._periodic.start()
+        if engine.is_async():
+            IOLoop.instance().add_callback(self._run_async)
+            return
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._periodic is not None:
+            self._periodic.stop()
+        self.release()
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        elif engine.is_async():
+            # NOTE: The IOLoop is stopped by now, what is left is sent here.
+            while self.buffer:
+                count = min(len(self.buffer), self.batch_size)
+                self.send([self.buffer.popleft() for _ in range(count)])
+
+    def publish(self, event, payload):
+        key = None
+        if self.window and event in COALESCED:
+            key = _member_key(payload)
+        if key is not None:
+            with self._cond:
+                if key in self.held:
+                    metrics.incr('notification.coalesced')
+                self.held[key] = (event, payload)
+            return
+
+        self._publish(event, payload)
+
+    def release(self):
+        """Publish the notifications held by the coalescing window."""
+        with self._cond:
+            held, self.held = self.held, collections.OrderedDict()
+        for event, payload in held.values():
+            self._publish(event, payload)
+
+    def _publish(self, event, payload):
+        notification = "queue.%s" % event.replace(" ", "_")
+        with self._cond:
+            if self.deltas is not None:
+                payload = self.deltas.encode(payload)
+            full = len(self.buffer) == self.buffer.maxlen
+            # NOTE: Everything in the buffer is older than everything in the
+            # spool, so keep spooling until the spool has been replayed.
+            if self.spool is not None and (
+                    full or self.broker_down or self._spooled()):
+                self.spool.append(notification, payload)
+                metrics.incr('notification.spooled')
+                self._cond.notify()
+                return
+
+            if full:
+                metrics.incr('notification.dropped')
+                LOG.warning('Notification buffer full, dropping %s',
+                            self.buffer[0][0])
+            self.buffer.append((notification, payload))
+            if len(self.buffer) in (1, self.batch_size):
+                self._cond.notify()
+
+    def _next_batch(self):
+        with self._cond:
+            while self.running and not self.buffer and not self._spooled():
+                self._cond.wait()
+            if self.running and 0 < len(self.buffer) < self.batch_size:
+                self._cond.wait(self.max_latency)
+
+            count = min(len(self.buffer), self.batch_size)
+            return [self.buffer.popleft() for _ in range(count)]
+
+    def _run(self):
+        while self.running or self.buffer:
+            batch = self._next_batch()
+            if batch:
+                self.send(batch)
+            elif self._spooled():
+                self.replay()
+
+    @gen.coroutine
+    def _run_async(self):
+        io_loop = IOLoop.instance()
+        while self.running or self.buffer:
+            if len(self.buffer) < self.batch_size:
+                yield gen.Task(
+                    io_loop.add_timeout, io_loop.time() + self.max_latency)
+
+            while self.buffer:
+                count = min(len(self.buffer), self.batch_size)
+                batch = [self.buffer.popleft() for _ in range(count)]
+                yield engine.submit('notifier', self.send, batch)
+
+            while self._spooled() and not self.buffer:
+                yield engine.submit('notifier', self.replay)
+                if self.broker_down and not self.running:
+                    return
+
+    def replay(self):
+        records, offset = self.spool.peek(self.batch_size)
+        self.send(records, spool=False)
+        if not self.broker_down:
+            self.spool.commit(records, offset)
+        metrics.incr('notification.spool.replayed', len(records))
+
+    def send(self, batch, spool=True):
+        """Send ``batch``, spooling what is left of it if the broker fails.
+
+        Records replayed from the spool are not spooled again, they are
+        retried until sent or the publisher stops.
+        """
+        for pos, (notification, payload) in enumerate(batch):
+            while True:
+                try:
+                    self.notifier.info(self.context, notification, payload)
+                    self.broker_down = False
+                    break
+                except Exception:
+                    LOG.exception('Failed to send %s', notification)
+                    if self.spool is None:
+                        break
+                    self.broker_down = True
+                    if spool:
+                        self._spool(batch[pos:])
+                        return
+                    if not self.running:
+                        return
+                    time.sleep(self.retry_interval)
+
+    def _spool(self, records):
+        with self._cond:
+            for notification, payload in records:
+                self.spool.append(notification, payload)
+            metrics.incr('notification.spooled', len(records))
+            self._cond.notify()
@@ -0,0 +1,71 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Positions of the callers waiting in each queue.
+
+Callers are kept in a list, in the order they entered, and a caller's
+position is its place in it. Queues hold few callers, and a caller leaving
+already returns the new position of everyone behind, so the list scans are
+no slower than the updates sent out for them.
+"""
+
+import threading
+
+
+class Index(object):
+    """Callers waiting in one queue, in the order they entered."""
+
+    def __init__(self):
+        self.uuids = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.uuids)
+
+    def __contains__(self, uuid):
+        return uuid in self.uuids
+
+    def callers(self):
+        """Return the uuids of the waiting callers, first to last."""
+        with self._lock:
+            return list(self.uuids)
+
+    def position(self, uuid):
+        with self._lock:
+            return self.uuids.index(uuid) + 1
+
+    def append(self, uuid):
+        """Add a caller at the end of the queue, returning its position."""
+        with self._lock:
+            self._remove(uuid)
+            self.uuids.append(uuid)
+
+            return len(self.uuids)
+
+    def remove(self, uuid):
+        """Remove a caller, returning who moved up behind it.
+
+        Each caller behind is returned as a ``(uuid, position)`` pair with
+        its new position.
+        """
+        with self._lock:
+            return self._remove(uuid)
+
+    def _remove(self, uuid):
+        try:
+            start = self.uuids.index(uuid)
+        except ValueError:
+            return []
+        del self.uuids[start]
+
+        return [(other, position) for position, other in
+                enumerate(self.uuids[start:], start + 1)]
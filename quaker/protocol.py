@@ -0,0 +1,216 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""A minimal Asterisk manager interface reader.
+
+Frames are parsed in place from one reusable buffer and only events with a
+registered callback are turned into dicts; every other event is skipped as
+soon as its ``Event:`` line has been read. Header names are lower cased and
+repeated headers joined with commas, the way python-ami presents them.
+"""
+
+import functools
+import itertools
+import socket
+
+from tornado.ioloop import IOLoop
+from tornado import iostream
+
+from quaker.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+_EOL = b'\r\n'
+_EOF = b'\r\n\r\n'
+_EVENT = b'Event: '
+_RESPONSE = b'Response: '
+
+
+def _str(data):
+    # NOTE: Headers stay native str, as python-ami hands them out.
+    return data if isinstance(data, str) else data.decode('utf-8')
+
+
+class FrameParser(object):
+
+    def __init__(self, events=()):
+        self.buffer = bytearray()
+        self.pos = 0
+        self.greeting = None
+        self.events = {}
+        self.skipped = 0
+        for event in events:
+            self.register(event)
+
+    def register(self, event):
+        self.events[event.encode('ascii')] = event
+
+    def reset(self):
+        """Forget the partial frame read, for a new connection."""
+        del self.buffer[:]
+        self.pos = 0
+        self.greeting = None
+
+    def feed(self, data):
+        if self.pos and self.pos * 2 >= len(self.buffer):
+            del self.buffer[:self.pos]
+            self.pos = 0
+        self.buffer.extend(data)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        buf = self.buffer
+        while True:
+            if self.greeting is None:
+                end = buf.find(_EOL, self.pos)
+                if end < 0:
+                    raise StopIteration
+                self.greeting = _str(bytes(buf[self.pos:end]))
+                self.pos = end + len(_EOL)
+                continue
+
+            end = buf.find(_EOF, self.pos)
+            if end < 0:
+                raise StopIteration
+            start, self.pos = self.pos, end + len(_EOF)
+
+            if buf.startswith(_EVENT, start):
+                eol = buf.find(_EOL, start, end + len(_EOL))
+                name = self.events.get(bytes(buf[start + len(_EVENT):eol]))
+                if name is None:
+                    self.skipped += 1
+                    continue
+            elif not buf.startswith(_RESPONSE, start):
+                continue
+
+            return self._headers(memoryview(buf)[start:end].tobytes())
+
+    next = __next__
+
+    def _headers(self, frame):
+        res = {}
+        for line in _str(frame).split('\r\n'):
+            key, _, value = line.partition(': ')
+            key = key.lower()
+            if key in res:
+                res[key] = '%s,%s' % (res[key], value)
+            else:
+                res[key] = value
+
+        return res
+
+
+class AMIClient(object):
+    """Read AMI events with :class:`FrameParser` over a tornado IOStream.
+
+    Offers the parts of the python-ami client the monitor uses. While
+    ``throttle`` returns True the client stops reading from Asterisk,
+    leaving the backlog in the kernel and Asterisk buffers. A closed
+    connection is retried with exponential backoff, and ``callback`` is
+    called again after each successful login.
+    """
+
+    chunk_size = 65536
+    retry_interval = 1
+    max_retry_interval = 60
+
+    def __init__(self):
+        self.parser = FrameParser()
+        self.callbacks = {}
+        self.actions = {}
+        self.action_ids = itertools.count(1)
+        self.stream = None
+        self.throttle = None
+        self.login = None
+        self.retry = self.retry_interval
+
+    def register_event(self, event, callback):
+        self.parser.register(event)
+        self.callbacks[event] = callback
+
+    def connect(self, hostname, username, password, callback=None,
+                port=5038):
+        self.login = (hostname, port, username, password, callback)
+        self._connect()
+
+    def _connect(self):
+        hostname, port, username, password, callback = self.login
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.stream = iostream.IOStream(sock)
+        self.stream.set_close_callback(self._on_close)
+        self.stream.connect((hostname, port), functools.partial(
+            self._on_connect, username, password, callback))
+
+    def _on_connect(self, username, password, callback):
+        self.send_action(
+            'Login', callback=functools.partial(self._on_login, callback),
+            Username=username, Secret=password)
+        self._read()
+
+    def _on_login(self, callback, frame):
+        if frame.get('response') != 'Success':
+            LOG.error('AMI login failed: %s', frame.get('message'))
+            self.stream.close()
+            return
+        self.retry = self.retry_interval
+        if callback is not None:
+            callback(frame)
+
+    def _on_close(self):
+        self.parser.reset()
+        self.actions.clear()
+        LOG.warning('AMI connection closed, reconnecting in %d seconds',
+                    self.retry)
+        io_loop = IOLoop.instance()
+        io_loop.add_timeout(io_loop.time() + self.retry, self._connect)
+        self.retry = min(self.retry * 2, self.max_retry_interval)
+
+    def send_action(self, action, callback=None, **headers):
+        action_id = str(next(self.action_ids))
+        if callback is not None:
+            self.actions[action_id] = callback
+        lines = ['Action: %s' % action, 'ActionID: %s' % action_id]
+        lines.extend('%s: %s' % item for item in sorted(headers.items()))
+        self.stream.write(('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8'))
+
+    def _read(self):
+        if self.stream.closed():
+            return
+        if self.throttle is not None and self.throttle():
+            IOLoop.instance().add_timeout(
+                IOLoop.instance().time() + 0.01,
+                functools.partial(self._resume, self.stream))
+            return
+        self.stream.read_bytes(
+            self.chunk_size, callback=self._on_data, partial=True)
+
+    def _resume(self, stream):
+        # NOTE: A reconnected stream is already being read.
+        if stream is self.stream:
+            self._read()
+
+    def _on_data(self, data):
+        self.parser.feed(data)
+        for frame in self.parser:
+            if 'response' in frame:
+                callback = self.actions.pop(frame.get('actionid'), None)
+            else:
+                callback = self.callbacks.get(frame['event'])
+            if callback is None:
+                continue
+            try:
+                callback(frame)
+            except Exception:
+                LOG.exception('Failed to handle %s', frame)
+        self._read()
@@ -0,0 +1,125 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Queues each member belongs to.
+
+Asterisk reports memberships one queue at a time, but logging out or pausing
+through the ``_CSRs`` queue concerns every queue of a member.
+:class:`Roster` keeps the queues of each member, so those changes are
+written to all of them in one batch. Queues dropped at logout are remembered
+until the member logs in again, and so are queues paused together, so the
+per-queue removals and pauses that may follow need no write of their own.
+"""
+
+import threading
+
+
+class Roster(object):
+
+    def __init__(self):
+        self.members = {}
+        self.dropped = {}
+        self.paused = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.members)
+
+    def queues(self, member):
+        """Return the queues ``member`` belongs to, sorted."""
+        with self._lock:
+            return sorted(self.members.get(member, ()))
+
+    def add(self, member, queue):
+        with self._lock:
+            self.members.setdefault(member, set()).add(queue)
+            dropped = self.dropped.get(member)
+            if dropped is not None:
+                dropped.discard(queue)
+            self._unpause(member, queue)
+
+    def remove(self, member, queue):
+        """Forget a membership, returning whether it must still be deleted.
+
+        Memberships already deleted by :meth:`drop` need not be.
+        """
+        with self._lock:
+            dropped = self.dropped.get(member, ())
+            if queue in dropped:
+                dropped.discard(queue)
+                return False
+
+            queues = self.members.get(member)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self.members[member]
+            return True
+
+    def drop(self, member, queues=None):
+        """Forget the memberships of ``member`` deleted at logout.
+
+        Every membership is forgotten unless ``queues`` is given. Returns the
+        queues forgotten.
+        """
+        with self._lock:
+            current = self.members.pop(member, set())
+            dropped = current if queues is None else current & set(queues)
+            if current - dropped:
+                self.members[member] = current - dropped
+            self.dropped.setdefault(member, set()).update(dropped)
+            return sorted(dropped)
+
+    def pause(self, member, queues, paused):
+        """Remember ``member`` was paused in ``queues`` through ``_CSRs``."""
+        with self._lock:
+            self.paused[member] = (paused, set(queues))
+
+    def pause_queue(self, member, queue, paused):
+        """Note a pause in one queue, returning whether it must be written.
+
+        Pauses already written by :meth:`pause` need not be.
+        """
+        with self._lock:
+            written = self.paused.get(member, (None, ()))[0]
+            if not self._unpause(member, queue):
+                return True
+            return written != paused
+
+    def _unpause(self, member, queue):
+        written = self.paused.get(member)
+        if written is None or queue not in written[1]:
+            return False
+        written[1].discard(queue)
+        if not written[1]:
+            del self.paused[member]
+        return True
+
+    def dump(self):
+        with self._lock:
+            return (
+                dict((member, sorted(queues))
+                     for member, queues in self.members.items()),
+                dict((member, sorted(queues))
+                     for member, queues in self.dropped.items()))
+
+    def restore(self, data):
+        members, dropped = data
+        with self._lock:
+            self.members = dict(
+                (member, set(queues)) for member, queues in members.items())
+            self.dropped = dict(
+                (member, set(queues)) for member, queues in dropped.items())
+
+    def login(self, member):
+        with self._lock:
+            self.dropped.pop(member, None)
@@ -0,0 +1,143 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Shard AMI event handling across worker processes by queue.
+
+A front process reads AMI and sends every event, pickled behind a 4 byte
+length, over a socketpair to the worker owning its queue on a consistent
+hash ring. Each queue has a single owner and each channel is a stream, so
+the events of a queue reach their worker in the order they were read.
+"""
+
+import os
+import socket
+import struct
+
+from oslo.config import cfg
+from six.moves import cPickle as pickle
+from tornado import iostream
+
+from quaker import hashring
+from quaker import metrics
+from quaker.openstack.common import log as logging
+
+OPTS = [
+    cfg.IntOpt(
+        'shard_workers', default=0,
+        help='Number of worker processes AMI events are sharded to by queue '
+        'name, 0 to handle events in the process reading AMI.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(OPTS)
+LOG = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct('!I')
+
+
+def encode(data):
+    payload = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+    return _LENGTH.pack(len(payload)) + payload
+
+
+class Router(object):
+    """Send events to the worker owning their queue."""
+
+    def __init__(self, channels):
+        self.streams = [iostream.IOStream(sock) for sock in channels]
+        self.ring = hashring.HashRing(range(len(channels)))
+        self.owners = {}
+
+    def owner(self, queue):
+        if queue not in self.owners:
+            self.owners[queue] = self.ring.get_node(queue)
+
+        return self.owners[queue]
+
+    def put(self, data, queue):
+        index = self.owner(queue)
+        try:
+            self.streams[index].write(encode(data))
+        except iostream.StreamClosedError:
+            metrics.incr('shard.dropped')
+            LOG.error('Shard worker %d is gone, dropping %s',
+                      index, data.get('event'))
+            return
+        metrics.incr('shard.%d.events' % index)
+
+
+class Reader(object):
+    """Pass events sent by a :class:`Router` to ``callback``."""
+
+    chunk_size = 65536
+
+    def __init__(self, channel, callback, on_close=None):
+        self.stream = iostream.IOStream(channel)
+        self.callback = callback
+        self.buffer = bytearray()
+        if on_close is not None:
+            self.stream.set_close_callback(on_close)
+
+    def start(self):
+        self._read()
+
+    def _read(self):
+        if self.stream.closed():
+            return
+        self.stream.read_bytes(
+            self.chunk_size, callback=self._on_data, partial=True)
+
+    def _on_data(self, data):
+        self.buffer.extend(data)
+        pos = 0
+        while len(self.buffer) - pos >= _LENGTH.size:
+            length = _LENGTH.unpack_from(self.buffer, pos)[0]
+            end = pos + _LENGTH.size + length
+            if end > len(self.buffer):
+                break
+            item = pickle.loads(bytes(self.buffer[pos + _LENGTH.size:end]))
+            pos = end
+            try:
+                self.callback(item)
+            except Exception:
+                LOG.exception('Failed to dispatch %s', item.get('event'))
+        del self.buffer[:pos]
+        self._read()
+
+
+def serve(worker, front):
+    """Fork ``shard_workers`` processes and run the front reader.
+
+    Each child runs ``worker(index, channel)`` then exits, the parent runs
+    ``front(router)``. Nothing holding sockets or threads may be created
+    before, as children inherit it.
+    """
+    channels = []
+    for index in range(CONF.shard_workers):
+        parent, child = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            parent.close()
+            for channel in channels:
+                channel.close()
+            try:
+                worker(index, child)
+            except Exception:
+                LOG.exception('Shard worker %d failed', index)
+                os._exit(1)
+            os._exit(0)
+        child.close()
+        channels.append(parent)
+        LOG.info('Started shard worker %d as process %d', index, pid)
+
+    front(Router(channels))
@@ -0,0 +1,184 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Periodic snapshots of the monitor state, to warm start from.
+
+A snapshot file holds a header with a magic, a format version, the sequence
+number of the last event dispatched, the time it was taken, and the length
+and CRC32 of the pickled state that follows. Snapshots are written to a
+temporary file then renamed over the previous one, so a crash leaves either
+snapshot whole. They are read back through a memory map, and the final one
+is written when the monitor stops.
+"""
+
+import collections
+import errno
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from oslo.config import cfg
+from six.moves import cPickle as pickle
+
+from quaker import engine
+from quaker import metrics
+from quaker.openstack.common import log as logging
+
+OPTS = [
+    cfg.StrOpt(
+        'snapshot_path', default=None,
+        help='File the monitor state is periodically snapshotted to, and '
+        'warm started from. Snapshots are disabled when unset.'),
+    cfg.FloatOpt(
+        'snapshot_interval', default=60,
+        help='Seconds between snapshots of the monitor state.'),
+    cfg.FloatOpt(
+        'snapshot_max_age', default=300,
+        help='Seconds after which a snapshot is too old to warm start from, '
+        '0 to always warm start.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(OPTS)
+LOG = logging.getLogger(__name__)
+
+MAGIC = b'QKSN'
+VERSION = 2
+
+_HEADER = struct.Struct('!4sHQdII')
+
+Snapshot = collections.namedtuple(
+    'Snapshot', ['sequence', 'created_at', 'state'])
+
+
+def _crc(data):
+    return zlib.crc32(data) & 0xffffffff
+
+
+def dump(path, sequence, state, timer=time.time):
+    """Write ``state`` to ``path``, replacing the previous snapshot."""
+    payload = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+    tmp = path + '.tmp'
+    # NOTE: A temporary file left over by a crash is not written through.
+    try:
+        os.unlink(tmp)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+    fd = os.open(tmp, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, sequence, timer(), len(payload),
+                             _crc(payload)))
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp, path)
+
+    return _HEADER.size + len(payload)
+
+
+def load(path, max_age=None, timer=time.time):
+    """Return the :class:`Snapshot` at ``path``, None if it is unusable."""
+    max_age = CONF.snapshot_max_age if max_age is None else max_age
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+
+    try:
+        size = os.fstat(fd).st_size
+        if size < _HEADER.size:
+            LOG.warning('Ignoring truncated snapshot %s', path)
+            return None
+        buf = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+    finally:
+        os.close(fd)
+
+    try:
+        magic, version, sequence, created_at, length, crc = (
+            _HEADER.unpack_from(buf))
+        if magic != MAGIC or version != VERSION:
+            LOG.warning('Ignoring snapshot %s of an unknown format', path)
+            return None
+        if _HEADER.size + length > size:
+            LOG.warning('Ignoring truncated snapshot %s', path)
+            return None
+        age = timer() - created_at
+        if max_age and age > max_age:
+            LOG.info('Ignoring snapshot %s taken %d seconds ago', path, age)
+            return None
+        payload = buf[_HEADER.size:_HEADER.size + length]
+    finally:
+        buf.close()
+
+    if _crc(payload) != crc:
+        LOG.warning('Ignoring corrupted snapshot %s', path)
+        return None
+    try:
+        state = pickle.loads(payload)
+    except Exception:
+        LOG.exception('Ignoring snapshot %s that cannot be unpickled', path)
+        return None
+
+    return Snapshot(sequence, created_at, state)
+
+
+class Writer(object):
+    """Snapshot what ``collect`` returns every ``interval`` seconds.
+
+    ``collect`` returns the sequence number and the state to snapshot. With
+    the async engine it is called on the IOLoop and the file is written on
+    an executor.
+    """
+
+    def __init__(self, path, collect, interval=None):
+        self.path = path
+        self.collect = collect
+        self.interval = interval or CONF.snapshot_interval
+        self.size = 0
+        self._periodic = engine.Periodic(self._tick, self.interval)
+
+        metrics.gauge('snapshot.bytes', lambda: self.size)
+
+    def write(self, sequence, state):
+        start = time.time()
+        self.size = dump(self.path, sequence, state)
+        metrics.incr('snapshot.writes')
+        LOG.debug('Snapshotted up to event %d in %.3f seconds',
+                  sequence, time.time() - start)
+
+    def start(self):
+        self._periodic.start()
+
+    def stop(self):
+        self._periodic.stop()
+        self.write(*self.collect())
+
+    def _tick(self):
+        try:
+            sequence, state = self.collect()
+        except Exception:
+            LOG.exception('Failed to collect the monitor state')
+            return
+        if engine.is_async():
+            engine.submit('snapshot', self._write, sequence, state)
+        else:
+            self._write(sequence, state)
+
+    def _write(self, sequence, state):
+        try:
+            self.write(sequence, state)
+        except Exception:
+            LOG.exception('Failed to snapshot the monitor state to %s',
+                          self.path)
@@ -0,0 +1,125 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Append-only on-disk spool of notifications.
+
+The file starts with an 8 byte header holding the offset of the next record
+to replay, followed by records made of a 4 byte length and a JSON document.
+Replay reads records through a memory map and only moves the header once a
+batch has been handed off, so a crash replays at most one batch twice. A
+record torn by a crash while appending is truncated when the spool is
+opened again.
+"""
+
+import mmap
+import os
+import struct
+import threading
+
+from quaker.openstack.common import jsonutils
+from quaker.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('!Q')
+_LENGTH = struct.Struct('!I')
+
+
+class Spool(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.depth = 0
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        if os.fstat(self._fd).st_size < _HEADER.size:
+            self._truncate()
+        else:
+            self._recover()
+
+    def __len__(self):
+        return self.depth
+
+    def close(self):
+        os.close(self._fd)
+
+    def _offset(self):
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        return _HEADER.unpack(os.read(self._fd, _HEADER.size))[0]
+
+    def _set_offset(self, offset):
+        fd = os.open(self.path, os.O_WRONLY)
+        try:
+            os.write(fd, _HEADER.pack(offset))
+        finally:
+            os.close(fd)
+
+    def _truncate(self):
+        os.ftruncate(self._fd, 0)
+        os.write(self._fd, _HEADER.pack(_HEADER.size))
+
+    def _recover(self):
+        records, offset = self._read(self._offset(), None)
+        self.depth = len(records)
+        if offset < os.fstat(self._fd).st_size:
+            LOG.warning('Truncating the torn record at the end of spool %s',
+                        self.path)
+            os.ftruncate(self._fd, offset)
+
+    def _read(self, offset, limit):
+        size = os.fstat(self._fd).st_size
+        records = []
+        if offset >= size:
+            return records, offset
+
+        buf = mmap.mmap(self._fd, size, access=mmap.ACCESS_READ)
+        try:
+            while offset < size and (limit is None or len(records) < limit):
+                # NOTE: Stop at a record torn by a crash while appending.
+                start = offset + _LENGTH.size
+                if start > size:
+                    break
+                length, = _LENGTH.unpack_from(buf, offset)
+                if start + length > size:
+                    break
+                try:
+                    records.append(jsonutils.loads(
+                        buf[start:start + length].decode('utf-8')))
+                except ValueError:
+                    break
+                offset = start + length
+        finally:
+            buf.close()
+
+        return records, offset
+
+    def append(self, notification, payload):
+        data = jsonutils.dumps([notification, payload])
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        with self._lock:
+            os.write(self._fd, _LENGTH.pack(len(data)) + data)
+            self.depth += 1
+
+    def peek(self, limit):
+        """Return up to ``limit`` of the oldest records and a commit token."""
+        with self._lock:
+            return self._read(self._offset(), limit)
+
+    def commit(self, records, offset):
+        """Drop ``records`` returned by :meth:`peek` from the spool."""
+        with self._lock:
+            self.depth -= len(records)
+            if offset >= os.fstat(self._fd).st_size:
+                self._truncate()
+            else:
+                self._set_offset(offset)
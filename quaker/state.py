@@ -0,0 +1,262 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Authoritative in-memory state of queue callers and members.
+
+:class:`State` offers the cache API the monitor uses, but reads and writes
+happen in memory; every write is also queued and replicated to the cache in
+ordered batches, so the cache becomes a durable mirror off the hot path.
+Callers and members unknown in memory, after a restart for instance, are
+read from the cache once and kept.
+"""
+
+import collections
+import functools
+import threading
+
+from oslo.config import cfg
+
+from quaker import cache
+from quaker import engine
+from quaker import metrics
+from quaker.openstack.common import log as logging
+from quaker.openstack.common import timeutils
+
+OPTS = [
+    cfg.BoolOpt(
+        'state_engine', default=False,
+        help='Keep queue callers and members in memory as the authoritative '
+        'state, replicating every change to the cache in batches.'),
+    cfg.FloatOpt(
+        'state_replication_interval', default=0.1,
+        help='Seconds between batches replicating the in-memory state to '
+        'the cache.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(OPTS)
+LOG = logging.getLogger(__name__)
+
+# NOTE: Caller statuses are 1 waiting, 2 ringing a member and 3 connected;
+# member statuses are 1 idle, 6 ringing and 2 on a call.
+STATUS_TRANSITIONS = {
+    'caller': {
+        1: (1, 2, 3),
+        2: (1, 2, 3),
+        3: (3,),
+    },
+    'member': {
+        1: (1, 6),
+        6: (1, 2, 6),
+        2: (1, 2),
+    },
+}
+
+
+class Record(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Queue(object):
+
+    def __init__(self):
+        self.callers = collections.OrderedDict()
+        self.members = {}
+
+
+class Batch(object):
+    """Apply writes to the state together, or not at all."""
+
+    def __init__(self, state):
+        self.state = state
+        self.ops = []
+
+    def __getattr__(self, name):
+        if name in cache.MUTATIONS:
+            return functools.partial(self._queue, name)
+        return getattr(self.state, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.ops = []
+
+    def _queue(self, method, *args, **kwargs):
+        self.ops.append((method, args, kwargs))
+
+    def commit(self):
+        ops, self.ops = self.ops, []
+        with self.state.lock:
+            for name, args, kwargs in ops:
+                getattr(self.state, name)(*args, **kwargs)
+
+
+class State(object):
+    """Queue callers and members in memory, mirrored to ``conn``."""
+
+    def __init__(self, conn, interval=None):
+        self.conn = conn
+        self.interval = interval or CONF.state_replication_interval
+        self.queues = {}
+        self.pending = []
+        self.lock = threading.RLock()
+        self._periodic = engine.Periodic(
+            self._flush, self.interval, channel='cache')
+
+        metrics.gauge('state.callers', lambda: sum(
+            len(queue.callers) for queue in self.queues.values()))
+        metrics.gauge('state.members', lambda: sum(
+            len(queue.members) for queue in self.queues.values()))
+        metrics.gauge('state.pending', lambda: len(self.pending))
+
+    def _entities(self, kind, queue_id, create=False):
+        queue = self.queues.get(queue_id)
+        if queue is None:
+            if not create:
+                return {}
+            queue = self.queues[queue_id] = Queue()
+
+        return getattr(queue, kind + 's')
+
+    def _replicate(self, method, queue_id, uuid, fields):
+        self.pending.append((method, (queue_id,), dict(fields, uuid=uuid)))
+
+    def get_many(self, keys):
+        with self.lock:
+            found = dict(
+                (key, self._entities(key[0], key[1]).get(key[2]))
+                for key in keys)
+        missing = [key for key in found if found[key] is None]
+        if missing:
+            # NOTE: The cache must have seen every write before it is read.
+            self.flush()
+            metrics.incr('state.misses', len(missing))
+            for key, record in zip(missing, self.conn.get_many(missing)):
+                if record is None:
+                    continue
+                with self.lock:
+                    entities = self._entities(key[0], key[1], create=True)
+                    found[key] = entities.setdefault(key[2], record)
+
+        return [found[key] for key in keys]
+
+    def get_queue_caller(self, queue_id, uuid):
+        return self.get_many([('caller', queue_id, uuid)])[0]
+
+    def get_queue_member(self, queue_id, uuid):
+        return self.get_many([('member', queue_id, uuid)])[0]
+
+    def list_queue_callers(self, queue_id):
+        # NOTE: Only the cache knows every caller, once it saw every write.
+        self.flush()
+        return self.conn.list_queue_callers(queue_id)
+
+    def create_queue_caller(self, queue_id, uuid, name, number, status):
+        with self.lock:
+            callers = self._entities('caller', queue_id, create=True)
+            callers.pop(uuid, None)
+            record = Record(
+                uuid=uuid, created_at=timeutils.isotime(), name=name,
+                number=number, position=len(callers) + 1, queue_id=queue_id,
+                status=status)
+            callers[uuid] = record
+            self._replicate('create_queue_caller', queue_id, uuid, dict(
+                name=name, number=number, status=status))
+
+        return record
+
+    def create_queue_member(self, queue_id, uuid, number, status):
+        with self.lock:
+            members = self._entities('member', queue_id, create=True)
+            record = members[uuid] = Record(
+                uuid=uuid, number=number, queue_id=queue_id, status=status)
+            self._replicate('create_queue_member', queue_id, uuid, dict(
+                number=number, status=status))
+
+        return record
+
+    def _update(self, kind, queue_id, uuid, fields):
+        with self.lock:
+            record = self._entities(kind, queue_id).get(uuid)
+            if record is not None:
+                self._check_status(kind, record, fields.get('status'))
+                for name, value in fields.items():
+                    setattr(record, name, value)
+            self._replicate(
+                'update_queue_%s' % kind, queue_id, uuid, fields)
+
+    def _check_status(self, kind, record, status):
+        current = getattr(record, 'status', None)
+        allowed = STATUS_TRANSITIONS[kind].get(current)
+        if status is None or allowed is None or status in allowed:
+            return
+        metrics.incr('state.invalid_transitions')
+        LOG.warning('Unexpected %s %s status change from %s to %s',
+                    kind, record.uuid, current, status)
+
+    def update_queue_caller(self, queue_id, uuid, **fields):
+        self._update('caller', queue_id, uuid, fields)
+
+    def update_queue_member(self, queue_id, uuid, **fields):
+        self._update('member', queue_id, uuid, fields)
+
+    def _delete(self, kind, queue_id, uuid):
+        with self.lock:
+            self._entities(kind, queue_id).pop(uuid, None)
+            self._replicate('delete_queue_%s' % kind, queue_id, uuid, {})
+
+    def delete_queue_caller(self, queue_id, uuid):
+        self._delete('caller', queue_id, uuid)
+
+    def delete_queue_member(self, queue_id, uuid):
+        self._delete('member', queue_id, uuid)
+
+    def batch(self, transaction=False, hold=True):
+        # NOTE: In memory every batch applies as a whole; replication keeps
+        # its writes in one cache batch.
+        return Batch(self)
+
+    def flush(self):
+        """Replicate every pending write to the cache in one batch."""
+        with self.lock:
+            ops, self.pending = self.pending, []
+        if not ops:
+            return
+
+        try:
+            with self.conn.batch() as batch:
+                for name, args, kwargs in ops:
+                    getattr(batch, name)(*args, **kwargs)
+        except Exception:
+            with self.lock:
+                self.pending[:0] = ops
+            raise
+        metrics.incr('state.replicated', len(ops))
+
+    def start(self):
+        self._periodic.start()
+
+    def stop(self):
+        self._periodic.stop()
+        self.flush()
+
+    def _flush(self):
+        try:
+            self.flush()
+        except Exception:
+            LOG.exception('Failed to replicate queue state, will retry')
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_cache
+----------------------------------
+
+Tests for `quaker.cache` module.
+"""
+
+import contextlib
+
+import fixtures
+from oslo.config import cfg
+
+from quaker import cache
+from quaker.tests import base
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.calls = []
+        self.pipelines = 0
+        self.lookups = 0
+
+    def get_queue_caller(self, queue_id, uuid):
+        self.lookups += 1
+        raise KeyError(uuid)
+
+    def __getattr__(self, name):
+        if name not in cache.MUTATIONS:
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return call
+
+
+class FakePipelineConnection(FakeConnection):
+
+    @contextlib.contextmanager
+    def pipeline(self, transaction=False):
+        self.pipelines += 1
+        yield self
+
+
+class FakeRecord(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeNode(object):
+    """An in-memory stand-in for one Redis node behind the payload API."""
+
+    def __init__(self, name):
+        self.name = name
+        self.callers = {}
+        self.members = {}
+        self.pipelines = 0
+
+    def create_queue_caller(self, queue_id, uuid, name, number, status):
+        self.callers[(queue_id, uuid)] = FakeRecord(
+            uuid=uuid, name=name, number=number, status=status,
+            position=len(self.list_queue_callers(queue_id)) + 1)
+
+    def get_queue_caller(self, queue_id, uuid):
+        return self.callers.get((queue_id, uuid))
+
+    def update_queue_caller(self, queue_id, uuid, **kwargs):
+        self.callers[(queue_id, uuid)].__dict__.update(kwargs)
+
+    def delete_queue_caller(self, queue_id, uuid):
+        del self.callers[(queue_id, uuid)]
+
+    def list_queue_callers(self, queue_id):
+        return [caller for key, caller in self.callers.items()
+                if key[0] == queue_id]
+
+    def create_queue_member(self, queue_id, uuid, number, status):
+        self.members[(queue_id, uuid)] = FakeRecord(
+            uuid=uuid, number=number, status=status, paused=0)
+
+    def get_queue_member(self, queue_id, uuid):
+        return self.members.get((queue_id, uuid))
+
+    def update_queue_member(self, queue_id, uuid, **kwargs):
+        self.members[(queue_id, uuid)].__dict__.update(kwargs)
+
+    def delete_queue_member(self, queue_id, uuid):
+        del self.members[(queue_id, uuid)]
+
+    def list_queue_members(self, queue_id):
+        return [member for key, member in self.members.items()
+                if key[0] == queue_id]
+
+    @contextlib.contextmanager
+    def pipeline(self, transaction=False):
+        self.pipelines += 1
+        yield self
+
+
+def get_fake_sharded(names):
+    nodes = dict((name, FakeNode(name)) for name in names)
+    sharded = cache.Sharded(dict(
+        (name, cache.Pool(lambda node=node: node, size=2))
+        for name, node in nodes.items()))
+
+    return sharded, nodes
+
+
+class TestBatch(base.TestCase):
+
+    def test_writes_are_deferred(self):
+        conn = FakeConnection()
+        batch = cache.Batch(cache.Connection(conn))
+        batch.update_queue_member(queue_id='q', uuid='m', status=1)
+        self.assertEqual([], conn.calls)
+        batch.commit()
+        self.assertEqual(
+            [('update_queue_member', (), {
+                'queue_id': 'q', 'uuid': 'm', 'status': 1})],
+            conn.calls)
+
+    def test_single_pipeline(self):
+        conn = FakePipelineConnection()
+        with cache.Batch(cache.Connection(conn)) as batch:
+            batch.update_queue_caller(queue_id='q', uuid='c', status=3)
+            batch.delete_queue_caller('q', uuid='c')
+            batch.update_queue_member(queue_id='q', uuid='m', status=2)
+        self.assertEqual(1, conn.pipelines)
+        self.assertEqual(
+            ['update_queue_caller', 'delete_queue_caller',
+             'update_queue_member'],
+            [name for name, _, _ in conn.calls])
+
+    def test_discarded_on_error(self):
+        conn = FakeConnection()
+
+        def handler():
+            with cache.Batch(cache.Connection(conn)) as batch:
+                batch.delete_queue_member(queue_id='q', uuid='m')
+                raise ValueError()
+
+        self.assertRaises(ValueError, handler)
+        self.assertEqual([], conn.calls)
+
+    def test_transaction_without_pipeline_warns_once(self):
+        self.useFixture(fixtures.MonkeyPatch('quaker.cache._NOT_ATOMIC', []))
+        conn = FakeConnection()
+        for _ in range(2):
+            with cache.Batch(cache.Connection(conn), transaction=True) as b:
+                b.delete_queue_member(queue_id='q', uuid='m')
+        self.assertEqual(2, len(conn.calls))
+        self.assertEqual(1, self.log_fixture.output.count('not atomic'))
+
+    def test_disabled(self):
+        conn = FakeConnection()
+        batch = cache.Batch(cache.Connection(conn), enabled=False)
+        batch.delete_queue_member(queue_id='q', uuid='m')
+        self.assertEqual(1, len(conn.calls))
+
+
+class TestConnection(base.TestCase):
+
+    def setUp(self):
+        super(TestConnection, self).setUp()
+        self.fake = FakeConnection()
+        self.conn = cache.Connection(self.fake)
+
+    def test_missing_caller_remembered(self):
+        self.assertIsNone(self.conn.get_queue_caller(queue_id='q', uuid='c'))
+        self.assertIsNone(self.conn.get_queue_caller(queue_id='q', uuid='c'))
+        self.assertEqual(1, self.fake.lookups)
+
+    def test_failed_lookup_not_remembered(self):
+        errors = [IOError('lost connection')]
+
+        def get_queue_caller(queue_id, uuid):
+            self.fake.lookups += 1
+            if errors:
+                raise errors.pop()
+            return 'record'
+
+        self.fake.get_queue_caller = get_queue_caller
+        self.assertRaises(
+            IOError, self.conn.get_queue_caller, queue_id='q', uuid='c')
+        self.assertEqual(
+            'record', self.conn.get_queue_caller(queue_id='q', uuid='c'))
+        self.assertEqual(2, self.fake.lookups)
+
+    def test_create_forgets_missing(self):
+        self.conn.get_queue_caller(queue_id='q', uuid='c')
+        with self.conn.batch() as batch:
+            batch.create_queue_caller('q', uuid='c', name='n', number='1')
+        self.conn.get_queue_caller(queue_id='q', uuid='c')
+        self.assertEqual(2, self.fake.lookups)
+
+    def test_delete_remembers_missing(self):
+        self.conn.delete_queue_caller('q', uuid='c')
+        self.assertIsNone(self.conn.get_queue_caller(queue_id='q', uuid='c'))
+        self.assertEqual(0, self.fake.lookups)
+
+
+class FakeMultiGetConnection(FakeNode):
+
+    def __init__(self):
+        super(FakeMultiGetConnection, self).__init__('multi')
+        self.multi_gets = []
+
+    def get_many(self, keys):
+        self.multi_gets.append(list(keys))
+        return [getattr(self, 'get_queue_%s' % kind)(queue_id, uuid)
+                for kind, queue_id, uuid in keys]
+
+
+class TestGetMany(base.TestCase):
+
+    def setUp(self):
+        super(TestGetMany, self).setUp()
+        self.fake = FakeMultiGetConnection()
+        self.fake.create_queue_caller('q', 'c', name='n', number='1',
+                                      status=1)
+        self.fake.create_queue_member('q', 'm', number='1', status=1)
+        self.conn = cache.Connection(self.fake)
+
+    def test_one_call(self):
+        caller, member, missing = self.conn.get_many(
+            [('caller', 'q', 'c'), ('member', 'q', 'm'),
+             ('caller', 'q', 'x')])
+        self.assertEqual('c', caller.uuid)
+        self.assertEqual('m', member.uuid)
+        self.assertIsNone(missing)
+        self.assertEqual(1, len(self.fake.multi_gets))
+
+        self.conn.get_many([('caller', 'q', 'x')])
+        self.assertEqual(1, len(self.fake.multi_gets))
+
+    def test_sharded(self):
+        sharded, nodes = get_fake_sharded(['a', 'b'])
+        queues = ['queue-%d' % i for i in range(10)]
+        for queue_id in queues:
+            nodes[sharded.node(queue_id)].create_queue_member(
+                queue_id, 'm', number=queue_id, status=1)
+        res = cache.Connection(sharded).get_many(
+            [('member', queue_id, 'm') for queue_id in queues])
+        self.assertEqual(queues, [member.number for member in res])
+
+
+class TestConnect(base.TestCase):
+
+    def setUp(self):
+        super(TestConnect, self).setUp()
+        conf = cfg.ConfigOpts()
+        conf.register_opts([cfg.StrOpt('host'), cfg.IntOpt('port'),
+                            cfg.IntOpt('cache_pool_size', default=2)])
+        self.useFixture(fixtures.MonkeyPatch('quaker.cache.CONF', conf))
+
+    def test_connect(self):
+        def get_instance():
+            return (cache.CONF.host, cache.CONF.port)
+
+        self.useFixture(fixtures.MonkeyPatch(
+            'quaker.cache.api.get_instance', get_instance))
+        self.assertEqual(('a', 6379), cache.connect('a', 6379))
+        self.assertIsNone(cache.CONF.host)
+
+    def test_pooled_per_node(self):
+        opened = []
+
+        def factory(host, port):
+            opened.append((host, port))
+            return object()
+
+        sharded = cache.get_sharded(['a:6379', 'b:6380'], factory=factory)
+        pool = sharded.pools['a:6379']
+        with pool.connection() as first:
+            with pool.connection() as second:
+                self.assertIsNot(first, second)
+        with sharded.pools['b:6380'].connection():
+            pass
+        self.assertEqual(
+            [('a', 6379), ('a', 6379), ('b', 6380)], opened)
+
+
+class TestPool(base.TestCase):
+
+    def test_reused(self):
+        created = []
+        pool = cache.Pool(lambda: created.append(1) or len(created), size=2)
+        with pool.connection() as first:
+            with pool.connection() as second:
+                self.assertEqual((1, 2), (first, second))
+        with pool.connection() as conn:
+            self.assertIn(conn, (1, 2))
+        self.assertEqual(2, len(created))
+
+    def test_failed_connect_released(self):
+        def factory():
+            raise IOError()
+
+        pool = cache.Pool(factory, size=1)
+        for _ in range(2):
+            self.assertRaises(IOError, pool.connection().__enter__)
+        self.assertEqual(0, pool.created)
+
+
+class TestSharded(base.TestCase):
+
+    def setUp(self):
+        super(TestSharded, self).setUp()
+        self.sharded, self.nodes = get_fake_sharded(['a:6379', 'b:6379'])
+        self.conn = cache.Connection(self.sharded)
+
+    def test_routed_by_queue(self):
+        queues = ['queue-%d' % i for i in range(20)]
+        for queue_id in queues:
+            self.conn.create_queue_member(
+                queue_id, uuid='m', number='1', status=1)
+        for queue_id in queues:
+            node = self.nodes[self.sharded.node(queue_id)]
+            self.assertEqual(1, node.get_queue_member(queue_id, 'm').status)
+            self.assertEqual(
+                1, self.conn.get_queue_member(queue_id, uuid='m').status)
+        self.assertTrue(all(node.members for node in self.nodes.values()))
+
+    def test_batch_split_per_node(self):
+        queues = ['queue-%d' % i for i in range(20)]
+        with self.conn.batch() as batch:
+            for queue_id in queues:
+                batch.create_queue_member(
+                    queue_id, uuid='m', number='1', status=1)
+        self.assertEqual(
+            [1, 1], [node.pipelines for node in self.nodes.values()])
+        self.assertEqual(
+            20, sum(len(node.members) for node in self.nodes.values()))
+
+    def test_transaction_on_one_node(self):
+        queues = ['queue-%d' % i for i in range(20)]
+
+        def commit():
+            with self.conn.batch(transaction=True) as batch:
+                for queue_id in queues:
+                    batch.create_queue_member(
+                        queue_id, uuid='m', number='1', status=1)
+
+        self.assertRaises(ValueError, commit)
+        self.assertEqual(
+            0, sum(len(node.members) for node in self.nodes.values()))
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_coalesce
+----------------------------------
+
+Tests for `quaker.coalesce` module.
+"""
+
+from quaker import cache
+from quaker import coalesce
+from quaker.tests import base
+from quaker.tests import test_cache
+
+
+class TestCoalescer(base.TestCase):
+
+    def setUp(self):
+        super(TestCoalescer, self).setUp()
+        self.node = test_cache.FakeNode('a')
+        self.node.create_queue_member('q', 'm', number='1', status=1)
+        self.writes = []
+        update = self.node.update_queue_member
+
+        def update_queue_member(queue_id, uuid, **kwargs):
+            self.writes.append((queue_id, uuid, kwargs))
+            update(queue_id, uuid, **kwargs)
+
+        self.node.update_queue_member = update_queue_member
+        self.updates = []
+        self.conn = cache.Connection(self.node)
+        self.conn.coalescer = coalesce.Coalescer(
+            self.conn, tick=1, listener=lambda *args: self.updates.append(
+                args))
+
+    def test_final_state_written(self):
+        for status in (6, 1, 6, 2):
+            with self.conn.batch(transaction=True) as batch:
+                batch.update_queue_member(queue_id='q', uuid='m',
+                                          status=status)
+        self.conn.update_queue_member(queue_id='q', uuid='m', paused=1)
+        self.assertEqual([], self.writes)
+        self.assertEqual(1, self.node.get_queue_member('q', 'm').status)
+
+        self.conn.coalescer.flush()
+        self.assertEqual([('q', 'm', {'status': 2, 'paused': 1})],
+                         self.writes)
+        self.assertEqual(2, self.node.get_queue_member('q', 'm').status)
+        self.assertEqual(
+            [('q', 'm', {'status': 6}), ('q', 'm', {'status': 1}),
+             ('q', 'm', {'status': 6}), ('q', 'm', {'status': 2}),
+             ('q', 'm', {'paused': 1})], self.updates)
+
+    def test_other_writes_pass_through(self):
+        self.node.create_queue_caller('q', 'c', name='n', number='1',
+                                      status=1)
+        with self.conn.batch(transaction=True) as batch:
+            batch.update_queue_caller(queue_id='q', uuid='c', status=2)
+            batch.update_queue_member(queue_id='q', uuid='m', status=6)
+        self.assertEqual(2, self.node.get_queue_caller('q', 'c').status)
+        self.assertEqual(1, self.node.pipelines)
+        self.assertEqual([], self.writes)
+
+    def test_delete_drops_pending(self):
+        self.conn.update_queue_member(queue_id='q', uuid='m', status=6)
+        self.conn.delete_queue_member('q', uuid='m')
+        self.conn.coalescer.flush()
+        self.assertEqual([], self.writes)
+        self.assertIsNone(self.node.get_queue_member('q', 'm'))
+
+    def test_stop_flushes(self):
+        self.conn.coalescer.start()
+        self.conn.update_queue_member(queue_id='q', uuid='m', status=6)
+        self.conn.coalescer.stop()
+        self.assertEqual([('q', 'm', {'status': 6})], self.writes)
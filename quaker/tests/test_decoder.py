@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_decoder
+----------------------------------
+
+Tests for `quaker.decoder` module.
+"""
+
+from quaker import decoder
+from quaker.tests import base
+
+
+class TestDecoder(base.TestCase):
+
+    def test_decode_variables(self):
+        res = decoder.decode_variables(
+            'MEMBERINTERFACE=SIP/1001,QUAKER_CALLER_ID=c1,'
+            'QUAKER_CALLER_NAME=Alice=A,NOT_QUAKER_X=1,QUAKER_EMPTY=')
+        self.assertEqual(
+            {'caller_id': 'c1', 'caller_name': 'Alice=A', 'empty': ''}, res)
+
+    def test_keys_interned(self):
+        first = decoder.decode_variables('QUAKER_QUEUE_NAME=sales')
+        second = decoder.decode_variables('QUAKER_QUEUE_NAME=support')
+        self.assertIs(list(first)[0], list(second)[0])
+
+    def test_member_number(self):
+        self.assertEqual('1001', decoder.member_number('SIP/1001@default'))
+        self.assertEqual('1001', decoder.member_number('Local/1001@agents/n'))
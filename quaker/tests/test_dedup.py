@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_dedup
+----------------------------------
+
+Tests for `quaker.dedup` module.
+"""
+
+from quaker import dedup
+from quaker.tests import base
+
+
+class TestDeduplicator(base.TestCase):
+
+    def setUp(self):
+        super(TestDeduplicator, self).setUp()
+        self.dedup = dedup.Deduplicator(
+            events=['AgentConnect', 'AgentComplete'], size=2, ttl=0)
+
+    def _event(self, event='AgentConnect', uniqueid='1.1',
+               member='SIP/1001'):
+        return {'event': event, 'uniqueid': uniqueid, 'membername': member}
+
+    def test_duplicate(self):
+        self.assertFalse(self.dedup.seen_before(self._event()))
+        self.assertTrue(self.dedup.seen_before(self._event()))
+        self.assertFalse(self.dedup.seen_before(
+            self._event(event='AgentComplete')))
+        self.assertFalse(self.dedup.seen_before(
+            self._event(member='SIP/1002')))
+        self.assertEqual(0.25, self.dedup.hit_rate())
+
+    def test_bounded(self):
+        for uniqueid in ('1', '2', '3'):
+            self.dedup.seen_before(self._event(uniqueid=uniqueid))
+        self.assertEqual(2, len(self.dedup.seen))
+        self.assertFalse(self.dedup.seen_before(self._event(uniqueid='1')))
+        self.assertTrue(self.dedup.footprint() > 0)
+
+    def test_other_events_ignored(self):
+        data = self._event(event='AgentCalled')
+        self.assertFalse(self.dedup.seen_before(data))
+        self.assertFalse(self.dedup.seen_before(data))
+        self.assertFalse(self.dedup.seen_before({'event': 'AgentConnect'}))
+        self.assertEqual(0, self.dedup.checked)
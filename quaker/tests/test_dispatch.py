@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_dispatch
+----------------------------------
+
+Tests for `quaker.dispatch` module.
+"""
+
+from tornado import gen
+
+from quaker import dispatch
+from quaker.tests import base
+
+
+class TestDispatcher(base.TestCase):
+
+    def setUp(self):
+        super(TestDispatcher, self).setUp()
+        self.handled = []
+
+    @gen.coroutine
+    def handler(self, data):
+        self.handled.append(data['id'])
+
+    def _fill(self, dispatcher, count):
+        for i in range(count):
+            dispatcher.put(self.handler, {'event': 'AgentCalled', 'id': i})
+
+    def test_drop_oldest(self):
+        dispatcher = dispatch.Dispatcher(size=2, overflow='drop-oldest')
+        self._fill(dispatcher, 3)
+        self.assertEqual(
+            [1, 2], [d['id'] for _, d, _ in dispatcher.lanes[0].items(None)])
+
+    def test_drop_newest(self):
+        dispatcher = dispatch.Dispatcher(size=2, overflow='drop-newest')
+        self._fill(dispatcher, 3)
+        self.assertEqual(
+            [0, 1], [d['id'] for _, d, _ in dispatcher.lanes[0].items(None)])
+
+    def test_round_robin(self):
+        lane = dispatch.Lane({'sales': 2})
+        for i in range(4):
+            lane.append('sales', ('sales', i))
+        lane.append('support', ('support', 0))
+        lane.append('billing', ('billing', 0))
+        self.assertEqual(
+            [('sales', 0), ('sales', 1), ('support', 0), ('billing', 0),
+             ('sales', 2), ('sales', 3)],
+            [lane.popleft() for _ in range(6)])
+        self.assertEqual(0, len(lane))
+
+    def test_ordered_per_key_across_queues(self):
+        lane = dispatch.Lane()
+        lane.append('sales', 1, key='SIP/1001')
+        lane.append('sales', 2, key='SIP/1002')
+        lane.append('_CSRs', 3, key='SIP/1001')
+        lane.append('support', 4, key='SIP/1003')
+        self.assertEqual([1, 4, 2, 3], [lane.popleft() for _ in range(4)])
+        self.assertEqual({}, lane.pinned)
+
+        lane.append('_CSRs', 5, key='SIP/1001')
+        self.assertEqual(['_CSRs'], list(lane.queues))
+
+    def test_drop_oldest_busiest_queue(self):
+        dispatcher = dispatch.Dispatcher(size=3, overflow='drop-oldest')
+        for i, queue in enumerate(['support', 'sales', 'sales', 'support']):
+            dispatcher.put(
+                self.handler, {'event': 'AgentCalled', 'id': i}, queue=queue)
+        lane = dispatcher.lanes[0]
+        self.assertEqual(
+            {'support': [0, 3], 'sales': [2]},
+            dict((queue, [d['id'] for _, d, _ in lane.items(queue)])
+                 for queue in lane.queues))
+
+    def test_unknown_overflow(self):
+        self.assertRaises(
+            ValueError, dispatch.Dispatcher, overflow='bogus')
+
+    def test_workers(self):
+        dispatcher = dispatch.Dispatcher(workers=1, size=2)
+        dispatcher.start()
+        self.addCleanup(dispatcher.stop)
+        self._fill(dispatcher, 10)
+        dispatcher.join(5)
+        self.assertEqual(list(range(10)), self.handled)
+
+    def test_ordered_per_key(self):
+        dispatcher = dispatch.Dispatcher(workers=4, size=100)
+        dispatcher.start()
+        self.addCleanup(dispatcher.stop)
+        for i in range(40):
+            dispatcher.put(
+                self.handler, {'event': 'AgentCalled', 'id': (i % 3, i)},
+                key=i % 3)
+        dispatcher.join(5)
+        for key in range(3):
+            ids = [i for k, i in self.handled if k == key]
+            self.assertEqual(sorted(ids), ids)
+        self.assertEqual(40, len(self.handled))
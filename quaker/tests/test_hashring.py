@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_hashring
+----------------------------------
+
+Tests for `quaker.hashring` module.
+"""
+
+
+from quaker import hashring
+from quaker.tests import base
+
+
+class TestHashRing(base.TestCase):
+
+    def test_keys_spread_over_nodes(self):
+        ring = hashring.HashRing(['a', 'b', 'c'])
+        owners = [ring.get_node('queue-%d' % i) for i in range(3000)]
+        for node in ('a', 'b', 'c'):
+            self.assertTrue(700 < owners.count(node) < 1300)
+
+    def test_stable(self):
+        ring = hashring.HashRing(['a', 'b'])
+        other = hashring.HashRing(['b', 'a'])
+        for i in range(100):
+            key = 'queue-%d' % i
+            self.assertEqual(ring.get_node(key), other.get_node(key))
+
+    def test_add_moves_only_keys_to_new_node(self):
+        ring = hashring.HashRing(['a', 'b', 'c'])
+        keys = ['queue-%d' % i for i in range(1000)]
+        before = dict((key, ring.get_node(key)) for key in keys)
+        ring.add('d')
+        moved = [key for key in keys if ring.get_node(key) != before[key]]
+        self.assertTrue(150 < len(moved) < 350)
+        self.assertEqual(set(['d']), set(ring.get_node(key) for key in moved))
+
+    def test_remove(self):
+        ring = hashring.HashRing(['a', 'b'])
+        ring.remove('a')
+        self.assertEqual(['b'], ring.nodes)
+        self.assertEqual('b', ring.get_node('sales'))
+        ring.remove('b')
+        self.assertRaises(LookupError, ring.get_node, 'sales')
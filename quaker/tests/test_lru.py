@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_lru
+----------------------------------
+
+Tests for `quaker.lru` module.
+"""
+
+from quaker import lru
+from quaker.tests import base
+
+
+class TestLRUCache(base.TestCase):
+
+    def setUp(self):
+        super(TestLRUCache, self).setUp()
+        self.now = 0
+        self.cache = lru.LRUCache(2, ttl=10, timer=lambda: self.now)
+
+    def test_least_recently_used_evicted(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.assertEqual(1, self.cache.get('a'))
+        self.cache.set('c', 3)
+        self.assertNotIn('b', self.cache)
+        self.assertEqual(1, self.cache.get('a'))
+        self.assertEqual(3, self.cache.get('c'))
+
+    def test_expired(self):
+        self.cache.set('a', 1)
+        self.now = 10
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(0, len(self.cache))
+
+    def test_pop(self):
+        self.cache.set('a', 1)
+        self.assertEqual(1, self.cache.pop('a'))
+        self.assertIsNone(self.cache.pop('a'))
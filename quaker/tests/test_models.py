@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_models
+----------------------------------
+
+Tests for `quaker.models` module.
+"""
+
+from quaker import models
+from quaker.tests import base
+
+
+class FakeRecord(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class TestRecords(base.TestCase):
+
+    def test_slots(self):
+        queue = models.Queue('sales', 'sales', '100')
+        self.assertFalse(hasattr(queue, '__dict__'))
+        self.assertRaises(AttributeError, setattr, queue, 'extra', 1)
+
+    def test_queue_payload(self):
+        queue = models.Queue(None, 'sales', '100')
+        self.assertEqual(
+            {'id': None, 'name': 'sales', 'number': '100'}, queue.payload)
+
+    def test_caller_payload(self):
+        caller = models.Caller.from_record(FakeRecord(
+            uuid='c1', created_at='now', name='Alice', number='6135550000',
+            position=2, queue_id='sales', status=1))
+        self.assertEqual({
+            'uuid': 'c1',
+            'created_at': 'now',
+            'name': 'Alice',
+            'number': '6135550000',
+            'position': 2,
+            'queue_id': 'sales',
+        }, caller.payload)
+        self.assertIs(caller.payload, caller.payload)
+
+
+class TestFragments(base.TestCase):
+
+    def test_shared(self):
+        fragments = models.Fragments(models.Member, maxsize=2)
+        member = fragments[None, 'SIP/1001', '1001']
+        self.assertEqual('1001', member.number)
+        self.assertIs(member, fragments[None, 'SIP/1001', '1001'])
+        self.assertIsNot(member, fragments['SIP/1001', 'SIP/1001', '1001'])
+
+    def test_bounded(self):
+        fragments = models.Fragments(models.Called, maxsize=2)
+        called = fragments['6135551234']
+        self.assertEqual({'number': '6135551234'}, called.payload)
+        fragments['6135551235']
+        fragments['6135551236']
+        self.assertEqual(1, len(fragments))
+        self.assertIsNot(called, fragments['6135551234'])
@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_monitor
+----------------------------------
+
+Tests for `quaker.monitor` module.
+"""
+
+import os
+import tempfile
+
+import fixtures
+from oslo.config import cfg
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from quaker import engine
+from quaker import metrics
+from quaker import monitor
+from quaker import notifier
+from quaker import snapshot
+from quaker.tests import base
+from quaker.tests import test_notifier
+
+
+class FakeRecord(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeAMIClient(object):
+
+    def __init__(self):
+        self.events = {}
+        self.sent = []
+
+    def register_event(self, event, callback):
+        self.events[event] = callback
+
+    def send_action(self, action, callback=None, **headers):
+        self.sent.append((action, headers))
+
+
+class FakeCache(object):
+    """An in-memory stand-in for the payload cache API."""
+
+    def __init__(self):
+        self.callers = {}
+        self.members = {}
+
+    def create_queue_caller(self, queue_id, uuid, name, number, status):
+        self.callers[(queue_id, uuid)] = FakeRecord(
+            uuid=uuid, created_at='now', name=name, number=number,
+            position=len(self.callers) + 1, queue_id=queue_id, status=status)
+        return self.callers[(queue_id, uuid)]
+
+    def get_queue_caller(self, queue_id, uuid):
+        return self.callers[(queue_id, uuid)]
+
+    def list_queue_callers(self, queue_id):
+        return [caller for (queue, _), caller in self.callers.items()
+                if queue == queue_id]
+
+    def update_queue_caller(self, queue_id, uuid, **kwargs):
+        self.callers[(queue_id, uuid)].__dict__.update(kwargs)
+
+    def delete_queue_caller(self, queue_id, uuid):
+        del self.callers[(queue_id, uuid)]
+
+    def create_queue_member(self, queue_id, uuid, number, status):
+        self.members[(queue_id, uuid)] = dict(number=number, status=status)
+
+    def get_queue_member(self, queue_id, uuid):
+        return self.members[(queue_id, uuid)]
+
+    def update_queue_member(self, queue_id, uuid, **kwargs):
+        self.members.setdefault((queue_id, uuid), {}).update(kwargs)
+
+    def delete_queue_member(self, queue_id, uuid):
+        del self.members[(queue_id, uuid)]
+
+
+VARIABLES = ','.join([
+    'QUAKER_CALLED_NUMBER=6135551234',
+    'QUAKER_CALLER_ID=c1',
+    'QUAKER_CALLER_NAME=Alice',
+    'QUAKER_CALLER_NUMBER=6135550000',
+    'QUAKER_QUEUE_NAME=sales',
+    'QUAKER_QUEUE_NUMBER=100',
+    'OTHER=ignored',
+])
+
+EVENTS = [
+    ('QueueMemberAdded', {
+        'event': 'QueueMemberAdded', 'queue': 'sales',
+        'membername': 'SIP/1001'}),
+    ('UserEvent', {
+        'event': 'UserEvent', 'userevent': 'QueueCallerCreate',
+        'quaker_queue_name': 'sales', 'quaker_caller_id': 'c1',
+        'quaker_caller_name': 'Alice', 'quaker_caller_number': '6135550000'}),
+    ('AgentCalled', {
+        'event': 'AgentCalled', 'agentname': 'SIP/1001',
+        'agentcalled': 'SIP/1001@default', 'variable': VARIABLES}),
+    ('AgentConnect', {
+        'event': 'AgentConnect', 'membername': 'SIP/1001',
+        'member': 'SIP/1001@default', 'uniqueid': '1.1',
+        'variable': VARIABLES}),
+    ('AgentComplete', {
+        'event': 'AgentComplete', 'membername': 'SIP/1001',
+        'member': 'SIP/1001@default', 'uniqueid': '1.1',
+        'variable': VARIABLES}),
+]
+
+
+class TestMonitor(base.TestCase):
+
+    def setUp(self):
+        super(TestMonitor, self).setUp()
+        self.fake = FakeCache()
+        self.useFixture(fixtures.MonkeyPatch(
+            'payload.cache.api.get_instance', lambda: self.fake))
+        self.useFixture(fixtures.MonkeyPatch(
+            'ami.client.AMIClient', FakeAMIClient))
+        self.notifier = test_notifier.FakeNotifier()
+        notifier._NOTIFIERS['quaker'] = self.notifier
+        self.addCleanup(notifier._NOTIFIERS.pop, 'quaker')
+        self.addCleanup(cfg.CONF.clear_override, 'engine')
+        self.addCleanup(cfg.CONF.clear_override, 'ami_event_mask')
+        self.addCleanup(cfg.CONF.clear_override, 'ami_event_filter')
+        self.addCleanup(engine.shutdown)
+
+    def _check_lifecycle(self, srv):
+        self.assertEqual({}, self.fake.callers)
+        self.assertEqual({'number': 'SIP/1001', 'status': 1},
+                         self.fake.members[('sales', 'SIP/1001')])
+
+        sent = [(event, payload) for event, payload in srv.publisher.buffer]
+        self.assertEqual(
+            ['queue.member.alert', 'queue.member.connect',
+             'queue.member.complete'], [event for event, _ in sent])
+        alert = sent[0][1]
+        self.assertEqual('Alice', alert['caller']['name'])
+        self.assertEqual('now', alert['caller']['created_at'])
+        self.assertEqual('1001', alert['member']['number'])
+        self.assertEqual('sales', alert['queue']['name'])
+        # NOTE: Notifications about the same queue and member share them.
+        for _, payload in sent[1:]:
+            self.assertIs(alert['queue'], payload['queue'])
+            self.assertIs(alert['called'], payload['called'])
+
+    def test_legacy(self):
+        srv = monitor.Monitor()
+        srv.dispatcher.start()
+        self.addCleanup(srv.dispatcher.stop)
+        for event, data in EVENTS:
+            srv.endpoints[0].ami.events[event](data)
+        srv.dispatcher.join(5)
+        self._check_lifecycle(srv)
+
+    def test_duplicates_dropped(self):
+        srv = monitor.Monitor()
+        srv.dispatcher.start()
+        self.addCleanup(srv.dispatcher.stop)
+        for event, data in EVENTS + EVENTS[3:]:
+            srv.endpoints[0].ami.events[event](dict(data))
+        srv.dispatcher.join(5)
+        self._check_lifecycle(srv)
+        self.assertEqual(2, srv.dedup.hits)
+
+    def test_state_engine(self):
+        cfg.CONF.set_override('state_engine', True)
+        self.addCleanup(cfg.CONF.clear_override, 'state_engine')
+        srv = monitor.Monitor()
+        srv.dispatcher.start()
+        self.addCleanup(srv.dispatcher.stop)
+        for event, data in EVENTS:
+            srv.endpoints[0].ami.events[event](dict(data))
+        srv.dispatcher.join(5)
+        srv.state.flush()
+        self.assertEqual({}, self.fake.callers)
+        self.assertEqual({'number': 'SIP/1001', 'status': 1},
+                         self.fake.members[('sales', 'SIP/1001')])
+        self.assertEqual(
+            ['queue.member.alert', 'queue.member.connect',
+             'queue.member.complete'],
+            [event for event, _ in srv.publisher.buffer])
+        alert = srv.publisher.buffer[0][1]
+        self.assertEqual('Alice', alert['caller']['name'])
+        self.assertEqual(1, alert['caller']['position'])
+
+    def test_single_worker(self):
+        cfg.CONF.set_override('dispatch_workers', 2)
+        self.addCleanup(cfg.CONF.clear_override, 'dispatch_workers')
+        self.assertRaises(ValueError, monitor.Monitor)
+
+    def test_cache_failure_still_notifies(self):
+        self.fake.create_queue_caller('sales', 'c1', 'Bob', '1', status=1)
+
+        def get_queue_caller(queue_id, uuid):
+            raise IOError('lost connection')
+
+        self.fake.get_queue_caller = get_queue_caller
+        srv = monitor.Monitor()
+        srv._handle_agent_called(dict(EVENTS[2][1]))
+        self.assertEqual(
+            ['queue.member.alert'],
+            [event for event, _ in srv.publisher.buffer])
+        alert = srv.publisher.buffer[0][1]
+        self.assertEqual('Alice', alert['caller']['name'])
+        self.assertIsNone(srv.cache.missing.get(('caller', 'sales', 'c1')))
+
+    def test_caller_positions(self):
+        srv = monitor.Monitor()
+        for uuid in ('c1', 'c2', 'c3'):
+            srv._handle_user_event({
+                'userevent': 'QueueCallerCreate',
+                'quaker_queue_name': 'sales', 'quaker_caller_id': uuid,
+                'quaker_caller_name': uuid, 'quaker_caller_number': uuid})
+        srv._handle_agent_connect(dict(EVENTS[3][1]))
+        self.assertEqual(
+            {'c2': 1, 'c3': 2},
+            dict((uuid, caller.position)
+                 for (_, uuid), caller in self.fake.callers.items()))
+
+        srv._handle_user_event({
+            'userevent': 'QueueCallerDelete',
+            'quaker_queue_name': 'sales', 'quaker_caller_id': 'c2'})
+        self.assertEqual(1, self.fake.callers[('sales', 'c3')].position)
+
+        moves = [payload for event, payload in srv.publisher.buffer
+                 if event == 'queue.caller.positions']
+        self.assertEqual(
+            [[{'uuid': 'c2', 'position': 1}, {'uuid': 'c3', 'position': 2}],
+             [{'uuid': 'c3', 'position': 1}]],
+            [payload['callers'] for payload in moves])
+        self.assertEqual('sales', moves[0]['queue']['name'])
+
+    def test_caller_positions_seeded(self):
+        self.fake.create_queue_caller('sales', 'c0', 'Bob', '1', status=1)
+        srv = monitor.Monitor()
+        srv._handle_user_event(dict(EVENTS[1][1]))
+        self.assertEqual(2, srv.positions['sales'].position('c1'))
+
+    def _membership(self, srv, event, queue):
+        handler = srv._handle_queue_member_added
+        if event == 'QueueMemberRemoved':
+            handler = srv._handle_queue_member_removed
+        handler({'event': event, 'queue': queue, 'membername': 'SIP/1001'})
+
+    def test_member_logout(self):
+        srv = monitor.Monitor()
+        self._membership(srv, 'QueueMemberAdded', '_CSRs')
+        for queue in ('sales', 'support'):
+            self._membership(srv, 'QueueMemberAdded', queue)
+        self.assertEqual(['sales', 'support'], srv.member_queues('SIP/1001'))
+
+        self._membership(srv, 'QueueMemberRemoved', '_CSRs')
+        self.assertEqual({}, self.fake.members)
+        self.assertEqual([], srv.member_queues('SIP/1001'))
+
+        # NOTE: Removals following the logout were already written.
+        before = metrics.snapshot()
+        self._membership(srv, 'QueueMemberRemoved', 'sales')
+        self.assertEqual(before.get('roster.skipped', 0) + 1,
+                         metrics.snapshot()['roster.skipped'])
+
+    def test_member_pause(self):
+        srv = monitor.Monitor()
+        for queue in ('sales', 'support'):
+            self._membership(srv, 'QueueMemberAdded', queue)
+        srv._handle_queue_member_paused({
+            'event': 'QueueMemberPaused', 'queue': '_CSRs',
+            'membername': 'SIP/1001', 'reason': 'lunch'})
+        self.assertEqual(
+            ['lunch', 'lunch'],
+            [member['paused'] for member in self.fake.members.values()])
+
+        # NOTE: The per-queue pauses following it were already written.
+        before = metrics.snapshot()
+        srv._handle_queue_member_paused({
+            'event': 'QueueMemberPaused', 'queue': 'sales',
+            'membername': 'SIP/1001', 'reason': 'lunch'})
+        self.assertEqual(before.get('roster.skipped', 0) + 1,
+                         metrics.snapshot()['roster.skipped'])
+
+    def test_stop_flushes(self):
+        cfg.CONF.set_override('state_engine', True)
+        self.addCleanup(cfg.CONF.clear_override, 'state_engine')
+        srv = monitor.Monitor()
+        self._membership(srv, 'QueueMemberAdded', 'sales')
+        self.assertEqual({}, self.fake.members)
+
+        srv.stop()
+        self.assertEqual([('sales', 'SIP/1001')], list(self.fake.members))
+        self.assertEqual([], srv.state.pending)
+
+    def test_warm_start(self):
+        cfg.CONF.set_override('state_engine', True)
+        self.addCleanup(cfg.CONF.clear_override, 'state_engine')
+        srv = monitor.Monitor()
+        self._membership(srv, 'QueueMemberAdded', 'sales')
+        for uuid in ('c1', 'c2'):
+            srv._handle_user_event({
+                'userevent': 'QueueCallerCreate',
+                'quaker_queue_name': 'sales', 'quaker_caller_id': uuid,
+                'quaker_caller_name': uuid, 'quaker_caller_number': uuid})
+        srv.sequence = 3
+        sequence, state = srv.collect()
+
+        srv.stop()
+
+        warm = monitor.Monitor()
+        warm.restore(snapshot.Snapshot(sequence, 0, state))
+        self.assertEqual(3, warm.sequence)
+        self.assertEqual(['sales'], warm.member_queues('SIP/1001'))
+        index = warm._get_positions('sales').result()
+        self.assertEqual(['c1', 'c2'], index.callers())
+        self.assertEqual('c2', warm.callers.get(('sales', 'c2')).name)
+        self.assertEqual([], warm.state.pending)
+
+    def test_warm_start_reconciled(self):
+        srv = monitor.Monitor()
+        for uuid in ('c1', 'c2'):
+            srv._handle_user_event({
+                'userevent': 'QueueCallerCreate',
+                'quaker_queue_name': 'sales', 'quaker_caller_id': uuid,
+                'quaker_caller_name': uuid, 'quaker_caller_number': uuid})
+        sequence, state = srv.collect()
+
+        # NOTE: Handled after the snapshot, before a crash.
+        self.fake.delete_queue_caller('sales', 'c1')
+        self.fake.create_queue_caller('sales', 'c3', 'c3', 'c3', status=1)
+
+        warm = monitor.Monitor()
+        warm.restore(snapshot.Snapshot(sequence, 0, state))
+        index = warm._get_positions('sales').result()
+        self.assertEqual(['c2', 'c3'], index.callers())
+        self.assertIsNone(warm.callers.get(('sales', 'c1')))
+        self.assertEqual(1, warm.callers.get(('sales', 'c2')).position)
+
+    def test_warm_start_lazy(self):
+        srv = monitor.Monitor()
+        srv._handle_user_event({
+            'userevent': 'QueueCallerCreate',
+            'quaker_queue_name': 'sales', 'quaker_caller_id': 'c1',
+            'quaker_caller_name': 'c1', 'quaker_caller_number': 'c1'})
+        sequence, state = srv.collect()
+
+        listed = []
+        self.useFixture(fixtures.MonkeyPatch(
+            'quaker.tests.test_monitor.FakeCache.list_queue_callers',
+            lambda cache, queue_id: listed.append(queue_id) or []))
+        warm = monitor.Monitor()
+        warm.restore(snapshot.Snapshot(sequence, 0, state))
+        self.assertEqual([], listed)
+        self.assertEqual(state, warm.collect()[1])
+
+    def test_stop_snapshots(self):
+        path = os.path.join(tempfile.mkdtemp(), 'snapshot')
+        srv = monitor.Monitor()
+        srv.sequence = 5
+        srv.snapshots = snapshot.Writer(path, srv.collect)
+        srv.stop()
+        self.assertEqual(5, snapshot.load(path).sequence)
+
+    def test_async(self):
+        cfg.CONF.set_override('engine', 'async')
+        srv = monitor.Monitor()
+
+        @gen.coroutine
+        def feed():
+            srv.dispatcher.start()
+            for event, data in EVENTS:
+                srv.endpoints[0].ami.events[event](data)
+            while not srv.dispatcher.idle():
+                yield gen.moment
+            srv.dispatcher.stop()
+
+        IOLoop.current().run_sync(feed)
+        self._check_lifecycle(srv)
+
+    def test_event_filter(self):
+        endpoint = monitor.Monitor().endpoints[0]
+        endpoint.on_connect({'response': 'Success'})
+        self.assertEqual(('Events', {'EventMask': 'agent,user'}),
+                         endpoint.ami.sent[0])
+        action, headers = endpoint.ami.sent[1]
+        self.assertEqual('Filter', action)
+        self.assertEqual('Add', headers['Operation'])
+        self.assertEqual(
+            'Event: (AgentCalled|AgentComplete|AgentConnect|'
+            'QueueMemberAdded|QueueMemberPaused|QueueMemberRemoved|'
+            'UserEvent)', headers['Filter'])
+
+    def test_event_filter_configured(self):
+        cfg.CONF.set_override('ami_event_mask', [])
+        cfg.CONF.set_override('ami_event_filter', ['AgentCalled'])
+        endpoint = monitor.Monitor().endpoints[0]
+        endpoint.on_connect({'response': 'Success'})
+        self.assertEqual(
+            [('Filter', {'Operation': 'Add',
+                         'Filter': 'Event: (AgentCalled)'})],
+            endpoint.ami.sent)
+
+    def test_event_filter_unsupported(self):
+        endpoint = monitor.Monitor().endpoints[0]
+        endpoint.ami.send_action = None
+        endpoint.on_connect({'response': 'Success'})
+        self.assertEqual([], endpoint.ami.sent)
+
+    def test_servers(self):
+        for name in ('pbx1', 'pbx2'):
+            group = 'ami:%s' % name
+            cfg.CONF.register_opts(monitor.SERVER_OPTS, group=group)
+            cfg.CONF.set_override('hostname', name, group=group)
+            self.addCleanup(cfg.CONF.clear_override, 'hostname', group)
+        cfg.CONF.set_override('ami_servers', ['pbx1', 'pbx2'])
+        self.addCleanup(cfg.CONF.clear_override, 'ami_servers')
+
+        srv = monitor.Monitor()
+        pbx1, pbx2 = srv.endpoints
+        self.assertEqual(('pbx1', 'pbx1'), (pbx1.name, pbx1.hostname))
+        self.assertEqual(('pbx2', 'pbx2'), (pbx2.name, pbx2.hostname))
+
+        before = metrics.snapshot()
+        srv.dispatcher.start()
+        self.addCleanup(srv.dispatcher.stop)
+        for event, data in EVENTS:
+            pbx1.ami.events[event](dict(data))
+        pbx2.ami.events['QueueMemberAdded']({
+            'event': 'QueueMemberAdded', 'queue': '_CSRs',
+            'membername': 'SIP/2001'})
+        srv.dispatcher.join(5)
+
+        self.assertEqual(
+            [('member.alert', 'pbx1'), ('member.complete', 'pbx1'),
+             ('member.connect', 'pbx1'), ('member.login', 'pbx2')],
+            sorted((event.split('.', 1)[1], payload['source'])
+                   for event, payload in srv.publisher.buffer))
+        after = metrics.snapshot()
+        self.assertEqual(5, after['ami.pbx1.events'] -
+                         before.get('ami.pbx1.events', 0))
+        self.assertEqual(1, after['ami.pbx2.handled'] -
+                         before.get('ami.pbx2.handled', 0))
+        self.assertTrue(0 <= after['ami.pbx1.lag'] < 5)
+
+    def test_sharded(self):
+        routed = []
+
+        class FakeRouter(object):
+            def put(self, data, queue):
+                routed.append((queue, data))
+
+        front = monitor.Front(FakeRouter())
+        for event, data in EVENTS:
+            front.endpoints[0].ami.events[event](dict(data))
+        self.assertEqual(['sales'] * len(EVENTS),
+                         [queue for queue, _ in routed])
+
+        srv = monitor.Monitor()
+        srv.dispatcher.start()
+        self.addCleanup(srv.dispatcher.stop)
+        for _, data in routed:
+            srv._receive(data)
+        srv.dispatcher.join(5)
+        self._check_lifecycle(srv)
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_notifier
+----------------------------------
+
+Tests for `quaker.notifier` module.
+"""
+
+import os
+import tempfile
+
+from oslo.config import cfg
+
+from quaker import notifier
+from quaker import spool
+from quaker.tests import base
+
+
+class FakeNotifier(object):
+
+    def __init__(self):
+        self.sent = []
+
+    def info(self, ctxt, event_type, payload):
+        self.sent.append((event_type, payload))
+
+
+class TestPublisher(base.TestCase):
+
+    def setUp(self):
+        super(TestPublisher, self).setUp()
+        self.notifier = FakeNotifier()
+        notifier._NOTIFIERS['test'] = self.notifier
+        self.addCleanup(notifier._NOTIFIERS.pop, 'test')
+        self.publisher = notifier.Publisher('test')
+
+    def test_batches(self):
+        self.publisher.batch_size = 2
+        for i in range(3):
+            self.publisher.publish('member.alert', {'id': i})
+        self.assertEqual([], self.notifier.sent)
+
+        self.publisher.send(self.publisher._next_batch())
+        self.assertEqual(
+            [('queue.member.alert', {'id': 0}),
+             ('queue.member.alert', {'id': 1})], self.notifier.sent)
+
+    def test_worker_drains_on_stop(self):
+        self.publisher.start()
+        self.publisher.publish('member.login', {})
+        self.publisher.stop()
+        self.assertEqual([('queue.member.login', {})], self.notifier.sent)
+
+    def test_failed_batch_spooled(self):
+        cfg.CONF.set_override('notification_spool_path',
+                              os.path.join(tempfile.mkdtemp(), 'spool'))
+        self.addCleanup(cfg.CONF.clear_override, 'notification_spool_path')
+        self.publisher = notifier.Publisher('test')
+        self.addCleanup(self.publisher.spool.close)
+
+        def info(ctxt, event_type, payload):
+            if payload['id'] >= 2:
+                raise IOError('broker down')
+            self.notifier.sent.append((event_type, payload))
+
+        self.notifier.info = info
+        for i in range(5):
+            self.publisher.publish('member.alert', {'id': i})
+        self.publisher.send(self.publisher._next_batch())
+        self.assertEqual([0, 1], [p['id'] for _, p in self.notifier.sent])
+        self.assertEqual(
+            [2, 3, 4],
+            [r[1]['id'] for r in self.publisher.spool.peek(10)[0]])
+        self.assertTrue(self.publisher.broker_down)
+
+    def test_async_drains_on_stop(self):
+        cfg.CONF.set_override('engine', 'async')
+        self.addCleanup(cfg.CONF.clear_override, 'engine')
+        self.publisher.start()
+        self.publisher.publish('member.login', {})
+        self.publisher.stop()
+        self.assertEqual([('queue.member.login', {})], self.notifier.sent)
+
+
+def member_payload(status, paused=0):
+    return {
+        'queue': {'id': None, 'name': 'sales', 'number': '100'},
+        'member': {'id': None, 'name': 'SIP/1001', 'number': '1001',
+                   'status': status, 'paused': paused},
+        'caller': {'uuid': 'c1', 'name': 'Alice'},
+    }
+
+
+class TestDeltaEncoder(base.TestCase):
+
+    def setUp(self):
+        super(TestDeltaEncoder, self).setUp()
+        self.now = 0
+        self.encoder = notifier.DeltaEncoder(
+            snapshot_interval=60, timer=lambda: self.now)
+
+    def test_deltas(self):
+        first = self.encoder.encode(member_payload(6))
+        self.assertEqual(True, first['snapshot'])
+        self.assertEqual(1, first['version'])
+        self.assertEqual('Alice', first['caller']['name'])
+
+        second = self.encoder.encode(member_payload(2))
+        self.assertEqual({
+            'queue': {'name': 'sales'},
+            'member': {'name': 'SIP/1001', 'status': 2},
+            'snapshot': False,
+            'version': 2,
+        }, second)
+
+        payload = member_payload(2, paused=1)
+        del payload['caller']
+        third = self.encoder.encode(payload)
+        self.assertEqual({'name': 'SIP/1001', 'paused': 1}, third['member'])
+        self.assertIsNone(third['caller'])
+        self.assertEqual(3, third['version'])
+
+    def test_periodic_snapshot(self):
+        self.encoder.encode(member_payload(6))
+        self.now = 59
+        self.assertFalse(self.encoder.encode(member_payload(1))['snapshot'])
+        self.now = 61
+        res = self.encoder.encode(member_payload(1))
+        self.assertTrue(res['snapshot'])
+        self.assertEqual(3, res['version'])
+        self.assertEqual('1001', res['member']['number'])
+
+    def test_without_member(self):
+        self.assertEqual({'id': 1}, self.encoder.encode({'id': 1}))
+
+
+class TestCoalescingPublisher(base.TestCase):
+
+    def setUp(self):
+        super(TestCoalescingPublisher, self).setUp()
+        self.notifier = FakeNotifier()
+        notifier._NOTIFIERS['test'] = self.notifier
+        self.addCleanup(notifier._NOTIFIERS.pop, 'test')
+        cfg.CONF.set_override('notification_coalesce_window', 10)
+        cfg.CONF.set_override('notification_mode', 'delta')
+        self.addCleanup(cfg.CONF.clear_override,
+                        'notification_coalesce_window')
+        self.addCleanup(cfg.CONF.clear_override, 'notification_mode')
+        self.publisher = notifier.Publisher('test')
+
+    def test_last_held_sent(self):
+        for status in (6, 1, 6, 2):
+            self.publisher.publish('member.update', member_payload(status))
+        self.publisher.publish('member.alert', {'id': 1})
+        self.assertEqual(1, len(self.publisher.buffer))
+
+        self.publisher.release()
+        self.publisher.release()
+        self.publisher.send(self.publisher._next_batch())
+        self.assertEqual(
+            ['queue.member.alert', 'queue.member.update'],
+            [event for event, _ in self.notifier.sent])
+        payload = self.notifier.sent[1][1]
+        self.assertEqual(2, payload['member']['status'])
+        self.assertEqual(1, payload['version'])
+
+    def test_lifecycle_not_held(self):
+        self.publisher.publish('member.complete', member_payload(1))
+        self.publisher.publish('member.alert', member_payload(6))
+        self.assertEqual(
+            ['queue.member.complete', 'queue.member.alert'],
+            [event for event, _ in self.publisher.buffer])
+        self.assertEqual({}, self.publisher.held)
+
+    def test_unknown_mode(self):
+        cfg.CONF.set_override('notification_mode', 'partial')
+        self.assertRaises(ValueError, notifier.Publisher, 'test')
+
+
+class TestSpool(base.TestCase):
+
+    def setUp(self):
+        super(TestSpool, self).setUp()
+        self.path = os.path.join(tempfile.mkdtemp(), 'spool')
+        self.spool = spool.Spool(self.path)
+        self.addCleanup(self.spool.close)
+
+    def test_replay_in_order(self):
+        for i in range(5):
+            self.spool.append('queue.member.alert', {'id': i})
+        self.assertEqual(5, len(self.spool))
+
+        records, offset = self.spool.peek(3)
+        self.assertEqual([0, 1, 2], [r[1]['id'] for r in records])
+        self.spool.commit(records, offset)
+        self.assertEqual(2, len(self.spool))
+
+        records, offset = self.spool.peek(3)
+        self.assertEqual([3, 4], [r[1]['id'] for r in records])
+
+    def test_reopen(self):
+        self.spool.append('queue.member.alert', {'id': 0})
+        self.spool.append('queue.member.alert', {'id': 1})
+        self.spool.commit(*self.spool.peek(1))
+
+        other = spool.Spool(self.path)
+        self.addCleanup(other.close)
+        self.assertEqual(1, len(other))
+        self.assertEqual(
+            [['queue.member.alert', {'id': 1}]], other.peek(10)[0])
+
+    def test_torn_record_truncated(self):
+        self.spool.append('queue.member.alert', {'id': 0})
+        size = os.path.getsize(self.path)
+        self.spool.append('queue.member.alert', {'id': 1})
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 3)
+
+        other = spool.Spool(self.path)
+        self.addCleanup(other.close)
+        self.assertEqual(1, len(other))
+        self.assertEqual(size, os.path.getsize(self.path))
+        other.append('queue.member.alert', {'id': 2})
+        self.assertEqual([0, 2], [r[1]['id'] for r in other.peek(10)[0]])
+
+    def test_truncated_once_drained(self):
+        self.spool.append('queue.member.alert', {'id': 0})
+        self.spool.commit(*self.spool.peek(10))
+        self.assertEqual(8, os.path.getsize(self.path))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_positions
+----------------------------------
+
+Tests for `quaker.positions` module.
+"""
+
+import random
+
+from quaker import positions
+from quaker.tests import base
+
+
+class TestIndex(base.TestCase):
+
+    def setUp(self):
+        super(TestIndex, self).setUp()
+        self.index = positions.Index()
+
+    def test_append(self):
+        self.assertEqual(1, self.index.append('c1'))
+        self.assertEqual(2, self.index.append('c2'))
+        self.assertEqual(2, self.index.position('c2'))
+
+    def test_remove(self):
+        for uuid in ('c1', 'c2', 'c3', 'c4'):
+            self.index.append(uuid)
+        self.assertEqual([('c3', 2), ('c4', 3)], self.index.remove('c2'))
+        self.assertEqual([], self.index.remove('c4'))
+        self.assertEqual([], self.index.remove('c5'))
+        self.assertEqual([('c3', 1)], self.index.remove('c1'))
+        self.assertEqual(1, len(self.index))
+
+    def test_append_again(self):
+        self.index.append('c1')
+        self.index.append('c2')
+        self.assertEqual(2, self.index.append('c1'))
+        self.assertEqual(1, self.index.position('c2'))
+
+    def test_matches_list(self):
+        rand = random.Random(42)
+        waiting = []
+        for number in range(2000):
+            if waiting and rand.random() < 0.45:
+                uuid = rand.choice(waiting)
+                start = waiting.index(uuid)
+                waiting.remove(uuid)
+                expected = [(other, start + offset + 1)
+                            for offset, other in enumerate(waiting[start:])]
+                self.assertEqual(expected, self.index.remove(uuid))
+            else:
+                waiting.append(number)
+                self.assertEqual(len(waiting), self.index.append(number))
+        for position, uuid in enumerate(waiting, 1):
+            self.assertEqual(position, self.index.position(uuid))
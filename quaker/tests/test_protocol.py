@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_protocol
+----------------------------------
+
+Tests for `quaker.protocol` module.
+"""
+
+import fixtures
+
+from quaker import protocol
+from quaker.tests import base
+
+STREAM = (
+    b'Asterisk Call Manager/1.1\r\n'
+    b'Response: Success\r\nActionID: 1\r\nMessage: Authentication accepted'
+    b'\r\n\r\n'
+    b'Event: Newchannel\r\nPrivilege: call,all\r\nChannel: SIP/1001-0001'
+    b'\r\n\r\n'
+    b'Event: AgentCalled\r\nPrivilege: agent,all\r\nAgentName: SIP/1001\r\n'
+    b'Variable: QUAKER_CALLER_ID=c1\r\nVariable: QUAKER_QUEUE_NAME=sales'
+    b'\r\n\r\n'
+)
+
+
+class TestFrameParser(base.TestCase):
+
+    def setUp(self):
+        super(TestFrameParser, self).setUp()
+        self.parser = protocol.FrameParser(['AgentCalled'])
+
+    def test_registered_events_only(self):
+        self.parser.feed(STREAM)
+        frames = list(self.parser)
+        self.assertEqual('Asterisk Call Manager/1.1', self.parser.greeting)
+        self.assertEqual(2, len(frames))
+        self.assertEqual('Success', frames[0]['response'])
+        self.assertEqual({
+            'event': 'AgentCalled',
+            'privilege': 'agent,all',
+            'agentname': 'SIP/1001',
+            'variable': 'QUAKER_CALLER_ID=c1,QUAKER_QUEUE_NAME=sales',
+        }, frames[1])
+        self.assertEqual(1, self.parser.skipped)
+
+    def test_partial_frames(self):
+        frames = []
+        for i in range(0, len(STREAM), 7):
+            self.parser.feed(STREAM[i:i + 7])
+            frames.extend(self.parser)
+        self.assertEqual(
+            ['Success', 'AgentCalled'],
+            [f.get('response', f.get('event')) for f in frames])
+        self.assertTrue(len(self.parser.buffer) < len(STREAM))
+
+
+class FakeStream(object):
+
+    def __init__(self):
+        self.written = []
+        self.closed_ = False
+
+    def write(self, data):
+        self.written.append(data)
+
+    def close(self):
+        self.closed_ = True
+
+    def closed(self):
+        return self.closed_
+
+
+class FakeIOLoop(object):
+
+    def __init__(self):
+        self.timeouts = []
+
+    def time(self):
+        return 100.0
+
+    def add_timeout(self, deadline, callback):
+        self.timeouts.append(deadline)
+
+
+class TestAMIClient(base.TestCase):
+
+    def setUp(self):
+        super(TestAMIClient, self).setUp()
+        self.io_loop = FakeIOLoop()
+        self.useFixture(fixtures.MonkeyPatch(
+            'quaker.protocol.IOLoop.instance', lambda: self.io_loop))
+        self.client = protocol.AMIClient()
+        self.client.stream = FakeStream()
+        self.connected = []
+
+    def test_login_failed(self):
+        self.client._on_login(self.connected.append, {
+            'response': 'Error', 'message': 'Authentication failed'})
+        self.assertEqual([], self.connected)
+        self.assertTrue(self.client.stream.closed())
+
+    def test_reconnect_backoff(self):
+        self.client.parser.feed(STREAM[:40])
+        for _ in range(7):
+            self.client._on_close()
+        self.assertEqual(
+            [101.0, 102.0, 104.0, 108.0, 116.0, 132.0, 160.0],
+            self.io_loop.timeouts)
+        self.assertEqual(0, len(self.client.parser.buffer))
+        self.assertIsNone(self.client.parser.greeting)
+
+        frame = {'response': 'Success', 'message': 'Authentication accepted'}
+        self.client._on_login(self.connected.append, frame)
+        self.assertEqual([frame], self.connected)
+        self.assertEqual(1, self.client.retry)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_rebalance
+----------------------------------
+
+Tests for `quaker.cmd.rebalance` module.
+"""
+
+from quaker.cmd import rebalance
+from quaker.tests import base
+from quaker.tests import test_cache
+
+
+class TestRebalance(base.TestCase):
+
+    def test_added_node(self):
+        previous, old_nodes = test_cache.get_fake_sharded(['a', 'b'])
+        current, new_nodes = test_cache.get_fake_sharded(['a', 'b', 'c'])
+        # NOTE: Both rings see the same Redis for the nodes they share.
+        for name in ('a', 'b'):
+            current.pools[name] = previous.pools[name]
+        new_nodes.update(old_nodes)
+
+        queues = ['queue-%d' % i for i in range(30)]
+        for queue_id in queues:
+            node = old_nodes[previous.node(queue_id)]
+            node.create_queue_caller(
+                queue_id, uuid='c1', name='Alice', number='1', status=1)
+            node.create_queue_caller(
+                queue_id, uuid='c2', name='Bob', number='2', status=1)
+            node.create_queue_member(queue_id, uuid='m', number='1', status=1)
+            node.update_queue_member(queue_id, uuid='m', paused='lunch')
+
+        moved = rebalance.rebalance(previous, current, queues)
+        self.assertTrue(moved)
+        self.assertEqual(set(['c']), set(target for _, _, target in moved))
+        for queue_id in queues:
+            owner = new_nodes[current.node(queue_id)]
+            callers = sorted(owner.list_queue_callers(queue_id),
+                             key=lambda caller: caller.position)
+            self.assertEqual(['c1', 'c2'], [c.uuid for c in callers])
+            self.assertEqual(
+                'lunch', owner.get_queue_member(queue_id, 'm').paused)
+            for node in new_nodes.values():
+                if node is not owner:
+                    self.assertEqual([], node.list_queue_callers(queue_id))
+                    self.assertEqual([], node.list_queue_members(queue_id))
+
+    def test_dry_run(self):
+        previous, old_nodes = test_cache.get_fake_sharded(['a'])
+        current, _ = test_cache.get_fake_sharded(['b'])
+        old_nodes['a'].create_queue_member('q', uuid='m', number='1',
+                                           status=1)
+        self.assertEqual([('q', 'a', 'b')], rebalance.rebalance(
+            previous, current, ['q'], dry_run=True))
+        self.assertEqual(1, len(old_nodes['a'].members))
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_roster
+----------------------------------
+
+Tests for `quaker.roster` module.
+"""
+
+from quaker import roster
+from quaker.tests import base
+
+
+class TestRoster(base.TestCase):
+
+    def setUp(self):
+        super(TestRoster, self).setUp()
+        self.roster = roster.Roster()
+        for queue in ('support', 'sales'):
+            self.roster.add('SIP/1001', queue)
+
+    def test_queues(self):
+        self.assertEqual(['sales', 'support'], self.roster.queues('SIP/1001'))
+        self.assertEqual([], self.roster.queues('SIP/1002'))
+
+    def test_remove(self):
+        self.assertTrue(self.roster.remove('SIP/1001', 'sales'))
+        self.assertTrue(self.roster.remove('SIP/1001', 'support'))
+        self.assertEqual(0, len(self.roster))
+        self.assertTrue(self.roster.remove('SIP/1002', 'sales'))
+
+    def test_drop(self):
+        self.assertEqual(['sales', 'support'], self.roster.drop('SIP/1001'))
+        self.assertEqual([], self.roster.queues('SIP/1001'))
+        self.assertFalse(self.roster.remove('SIP/1001', 'sales'))
+        self.assertTrue(self.roster.remove('SIP/1001', 'billing'))
+
+    def test_login(self):
+        self.roster.drop('SIP/1001')
+        self.roster.login('SIP/1001')
+        self.roster.add('SIP/1001', 'sales')
+        self.assertTrue(self.roster.remove('SIP/1001', 'sales'))
+        self.assertTrue(self.roster.remove('SIP/1001', 'support'))
+
+    def test_drop_queues(self):
+        self.assertEqual(['sales'], self.roster.drop('SIP/1001', ['sales']))
+        self.assertEqual(['support'], self.roster.queues('SIP/1001'))
+        self.assertFalse(self.roster.remove('SIP/1001', 'sales'))
+
+    def test_pause(self):
+        self.roster.pause('SIP/1001', ['sales', 'support'], 'lunch')
+        self.assertFalse(self.roster.pause_queue('SIP/1001', 'sales', 'lunch'))
+        self.assertTrue(self.roster.pause_queue('SIP/1001', 'sales', 'lunch'))
+        self.assertTrue(self.roster.pause_queue('SIP/1001', 'support', 0))
+        self.assertEqual({}, self.roster.paused)
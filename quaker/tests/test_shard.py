@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_shard
+----------------------------------
+
+Tests for `quaker.shard` module.
+"""
+
+
+import socket
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from quaker import shard
+from quaker.tests import base
+
+
+class TestShard(base.TestCase):
+
+    def test_route_by_queue(self):
+        pairs = [socket.socketpair() for _ in range(3)]
+        received = [[] for _ in pairs]
+        events = [
+            {'event': 'AgentCalled', 'queue': 'q%d' % (i % 7), 'seq': i}
+            for i in range(200)]
+
+        @gen.coroutine
+        def run():
+            router = shard.Router([parent for parent, _ in pairs])
+            for index, (_, child) in enumerate(pairs):
+                shard.Reader(child, received[index].append).start()
+            for data in events:
+                router.put(data, data['queue'])
+            while sum(len(items) for items in received) < len(events):
+                yield gen.moment
+
+        IOLoop.current().run_sync(run, timeout=5)
+
+        owners = {}
+        for index, items in enumerate(received):
+            for data in items:
+                owner = owners.setdefault(data['queue'], index)
+                self.assertEqual(index, owner)
+            seqs = [data['seq'] for data in items]
+            self.assertEqual(sorted(seqs), seqs)
+        self.assertEqual(7, len(owners))
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_snapshot
+----------------------------------
+
+Tests for `quaker.snapshot` module.
+"""
+
+import os
+import tempfile
+
+from quaker import snapshot
+from quaker.tests import base
+
+
+class TestSnapshot(base.TestCase):
+
+    def setUp(self):
+        super(TestSnapshot, self).setUp()
+        self.path = os.path.join(tempfile.mkdtemp(), 'snapshot')
+        self.now = 1000.0
+
+    def _timer(self):
+        return self.now
+
+    def test_roundtrip(self):
+        snapshot.dump(self.path, 42, {'queues': ['sales']}, timer=self._timer)
+        snap = snapshot.load(self.path, max_age=60, timer=self._timer)
+        self.assertEqual(42, snap.sequence)
+        self.assertEqual(1000.0, snap.created_at)
+        self.assertEqual({'queues': ['sales']}, snap.state)
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_private(self):
+        open(self.path + '.tmp', 'w').close()
+        snapshot.dump(self.path, 1, {}, timer=self._timer)
+        self.assertEqual(0o600, os.stat(self.path).st_mode & 0o777)
+
+    def test_missing(self):
+        self.assertIsNone(snapshot.load(self.path))
+
+    def test_too_old(self):
+        snapshot.dump(self.path, 1, {}, timer=self._timer)
+        self.now += 61
+        self.assertIsNone(
+            snapshot.load(self.path, max_age=60, timer=self._timer))
+        self.assertIsNotNone(
+            snapshot.load(self.path, max_age=0, timer=self._timer))
+
+    def test_truncated(self):
+        snapshot.dump(self.path, 1, {'queues': ['sales']}, timer=self._timer)
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        self.assertIsNone(snapshot.load(self.path, timer=self._timer))
+        with open(self.path, 'r+b') as f:
+            f.truncate(3)
+        self.assertIsNone(snapshot.load(self.path, timer=self._timer))
+
+    def test_unknown_format(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * 64)
+        self.assertIsNone(snapshot.load(self.path, timer=self._timer))
+
+    def test_corrupted(self):
+        snapshot.dump(self.path, 1, {'queues': ['sales']}, timer=self._timer)
+        with open(self.path, 'rb') as f:
+            data = bytearray(f.read())
+        data[-2] ^= 0xff
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        self.assertIsNone(snapshot.load(self.path, timer=self._timer))
+
+    def test_unpicklable(self):
+        payload = b'not a pickle'
+        with open(self.path, 'wb') as f:
+            f.write(snapshot._HEADER.pack(
+                snapshot.MAGIC, snapshot.VERSION, 1, self.now, len(payload),
+                snapshot._crc(payload)))
+            f.write(payload)
+        self.assertIsNone(snapshot.load(self.path, timer=self._timer))
+
+    def test_writer(self):
+        writer = snapshot.Writer(
+            self.path, lambda: (7, {'queues': []}), interval=60)
+        writer.stop()
+        self.assertEqual(7, snapshot.load(self.path).sequence)
+        self.assertEqual(os.path.getsize(self.path), writer.size)
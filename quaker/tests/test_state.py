@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_state
+----------------------------------
+
+Tests for `quaker.state` module.
+"""
+
+from quaker import cache
+from quaker import metrics
+from quaker import state
+from quaker.tests import base
+from quaker.tests import test_cache
+from quaker import transitions
+
+
+class TestState(base.TestCase):
+
+    def setUp(self):
+        super(TestState, self).setUp()
+        self.node = test_cache.FakeNode('a')
+        self.state = state.State(cache.Connection(self.node), interval=1)
+
+    def test_writes_in_memory_then_replicated(self):
+        caller = self.state.create_queue_caller(
+            'q', uuid='c', name='Alice', number='1', status=1)
+        self.state.create_queue_member('q', uuid='m', number='1', status=1)
+        transitions.Engine(self.state).apply(
+            'agent_called', queue_id='q', caller_uuid='c', member_uuid='m')
+
+        self.assertEqual(1, caller.position)
+        self.assertEqual(2, self.state.get_queue_caller('q', 'c').status)
+        self.assertEqual(6, self.state.get_queue_member('q', 'm').status)
+        self.assertEqual({}, self.node.callers)
+
+        self.state.flush()
+        self.assertEqual(1, self.node.pipelines)
+        self.assertEqual(2, self.node.get_queue_caller('q', 'c').status)
+        self.assertEqual('m', self.node.get_queue_caller('q', 'c').member_uuid)
+        self.assertEqual(6, self.node.get_queue_member('q', 'm').status)
+
+    def test_delete(self):
+        self.state.create_queue_caller(
+            'q', uuid='c', name='Alice', number='1', status=1)
+        with self.state.batch() as batch:
+            batch.delete_queue_caller('q', uuid='c')
+        self.assertIsNone(self.state.get_queue_caller('q', 'c'))
+        self.assertEqual({}, self.node.callers)
+
+    def test_miss_read_from_cache_once(self):
+        self.node.create_queue_caller('q', 'c', name='Alice', number='1',
+                                      status=1)
+        self.node.get_queue_caller = self._count(self.node.get_queue_caller)
+        self.assertEqual('Alice', self.state.get_queue_caller('q', 'c').name)
+        self.assertEqual('Alice', self.state.get_queue_caller('q', 'c').name)
+        self.assertEqual(1, self.lookups)
+
+    def _count(self, func):
+        self.lookups = 0
+
+        def wrapper(*args, **kwargs):
+            self.lookups += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    def test_invalid_transition_counted(self):
+        self.state.create_queue_member('q', uuid='m', number='1', status=2)
+        before = metrics.snapshot().get('state.invalid_transitions', 0)
+        self.state.update_queue_member(queue_id='q', uuid='m', status=6)
+        self.assertEqual(6, self.state.get_queue_member('q', 'm').status)
+        self.assertEqual(
+            before + 1, metrics.snapshot()['state.invalid_transitions'])
+
+    def test_failed_replication_retried(self):
+        self.state.create_queue_member('q', uuid='m', number='1', status=1)
+        create = self.node.create_queue_member
+
+        def fail(*args, **kwargs):
+            raise IOError()
+
+        self.node.create_queue_member = fail
+        self.assertRaises(IOError, self.state.flush)
+        self.assertEqual(1, len(self.state.pending))
+        self.node.create_queue_member = create
+        self.state.flush()
+        self.assertEqual(1, self.node.get_queue_member('q', 'm').status)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+test_transitions
+----------------------------------
+
+Tests for `quaker.transitions` module.
+"""
+
+from quaker import cache
+from quaker.tests import base
+from quaker.tests import test_cache
+from quaker import transitions
+
+
+class TestEngine(base.TestCase):
+
+    def setUp(self):
+        super(TestEngine, self).setUp()
+        self.conn = test_cache.FakePipelineConnection()
+        self.engine = transitions.Engine(cache.Connection(self.conn))
+
+    def test_agent_connect(self):
+        self.engine.apply(
+            'agent_connect', queue_id='q', caller_uuid='c', member_uuid='m')
+        self.assertEqual(1, self.conn.pipelines)
+        self.assertEqual(
+            ['update_queue_caller', 'delete_queue_caller',
+             'update_queue_member'],
+            [name for name, _, _ in self.conn.calls])
+
+    def test_agent_connect_moved(self):
+        self.engine.apply(
+            'agent_connect', queue_id='q', caller_uuid='c', member_uuid='m',
+            moved=[('c2', 1), ('c3', 2)])
+        self.assertEqual(1, self.conn.pipelines)
+        self.assertEqual(
+            [{'queue_id': 'q', 'uuid': 'c2', 'position': 1},
+             {'queue_id': 'q', 'uuid': 'c3', 'position': 2}],
+            [kwargs for _, _, kwargs in self.conn.calls[3:]])
+
+    def test_caller_delete(self):
+        self.engine.apply(
+            'caller_delete', queue_id='q', caller_uuid=None,
+            moved=[('c2', 1)])
+        self.assertEqual(
+            ['update_queue_caller'],
+            [name for name, _, _ in self.conn.calls])
+
+    def test_member_cancel(self):
+        self.engine.apply(
+            'member_cancel', queue_id='q', caller_uuid=None, member_uuid='m')
+        self.assertEqual(1, self.conn.pipelines)
+        self.assertEqual(
+            [('update_queue_member', (), {
+                'queue_id': 'q', 'uuid': 'm', 'status': 1})],
+            self.conn.calls)
+
+    def test_member_logout(self):
+        self.engine.apply('member_logout', member_uuid='m', queues=['q', 'r'])
+        self.assertEqual(1, self.conn.pipelines)
+        self.assertEqual(
+            ['delete_queue_member', 'delete_queue_member'],
+            [name for name, _, _ in self.conn.calls])
+
+    def test_member_logout_sharded(self):
+        sharded, nodes = test_cache.get_fake_sharded(['a', 'b'])
+        queues = ['q%d' % i for i in range(8)]
+        for queue in queues:
+            nodes[sharded.node(queue)].create_queue_member(
+                queue, 'm', number='1', status=1)
+        self.assertEqual(2, len(set(map(sharded.node, queues))))
+
+        engine = transitions.Engine(cache.Connection(sharded))
+        engine.apply('member_logout', member_uuid='m', queues=queues)
+        self.assertEqual({}, nodes['a'].members)
+        self.assertEqual({}, nodes['b'].members)
+
+    def test_unknown(self):
+        self.assertRaises(KeyError, self.engine.apply, 'bogus')
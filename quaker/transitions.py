@@ -0,0 +1,105 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Lifecycle transitions for queue callers and members.
+
+Each transition describes every cache write a single AMI event implies. The
+engine applies a transition as one transactional batch: a MULTI/EXEC request
+on backends with pipelines, so other events never observe a caller or member
+half way through a step. Backends without pipelines get the writes one at a
+time, and queue member updates held by the coalescer are written a tick
+later, outside the transaction. Transitions writing every queue of a member
+are batched without a transaction, as those queues may be sharded across
+cache nodes.
+"""
+
+_TRANSITIONS = {}
+
+
+def transition(name, transaction=True):
+    def decorator(func):
+        _TRANSITIONS[name] = (func, transaction)
+        return func
+    return decorator
+
+
+def _move_callers(batch, queue_id, moved):
+    for uuid, position in moved:
+        batch.update_queue_caller(
+            queue_id=queue_id, uuid=uuid, position=position)
+
+
+@transition('agent_called')
+def _agent_called(batch, queue_id, caller_uuid, member_uuid):
+    batch.update_queue_caller(
+        queue_id=queue_id, uuid=caller_uuid, member_uuid=member_uuid,
+        status=2)
+    batch.update_queue_member(queue_id=queue_id, uuid=member_uuid, status=6)
+
+
+@transition('agent_complete')
+def _agent_complete(batch, queue_id, member_uuid):
+    batch.update_queue_member(queue_id=queue_id, uuid=member_uuid, status=1)
+
+
+@transition('agent_connect')
+def _agent_connect(batch, queue_id, caller_uuid, member_uuid, moved=()):
+    batch.update_queue_caller(queue_id=queue_id, uuid=caller_uuid, status=3)
+    batch.delete_queue_caller(queue_id, uuid=caller_uuid)
+    batch.update_queue_member(queue_id=queue_id, uuid=member_uuid, status=2)
+    _move_callers(batch, queue_id, moved)
+
+
+@transition('caller_delete')
+def _caller_delete(batch, queue_id, caller_uuid, moved=()):
+    if caller_uuid is not None:
+        batch.delete_queue_caller(queue_id, uuid=caller_uuid)
+    _move_callers(batch, queue_id, moved)
+
+
+@transition('caller_move')
+def _caller_move(batch, queue_id, moved):
+    _move_callers(batch, queue_id, moved)
+
+
+@transition('member_cancel')
+def _member_cancel(batch, queue_id, caller_uuid, member_uuid):
+    batch.update_queue_member(queue_id=queue_id, uuid=member_uuid, status=1)
+    if caller_uuid is not None:
+        batch.update_queue_caller(
+            queue_id=queue_id, uuid=caller_uuid, status=1)
+
+
+@transition('member_logout', transaction=False)
+def _member_logout(batch, member_uuid, queues):
+    for queue in queues:
+        batch.delete_queue_member(queue_id=queue, uuid=member_uuid)
+
+
+@transition('member_pause', transaction=False)
+def _member_pause(batch, member_uuid, queues, paused):
+    for queue in queues:
+        batch.update_queue_member(
+            queue_id=queue, uuid=member_uuid, paused=paused)
+
+
+class Engine(object):
+    """Apply named lifecycle transitions against the cache."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.transitions = dict(_TRANSITIONS)
+
+    def apply(self, name, **kwargs):
+        func, transaction = self.transitions[name]
+        with self.conn.batch(transaction=transaction) as batch:
+            func(batch, **kwargs)
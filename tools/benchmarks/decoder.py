@@ -0,0 +1,82 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compare quaker.decoder with the original split based parsing.
+
+Run with::
+
+    python tools/benchmarks/decoder.py
+"""
+
+import re
+import timeit
+
+from quaker import decoder
+
+# NOTE: A Variable header as sent with AgentCalled by our dialplan, with the
+# channel variables Asterisk adds on its own.
+VARIABLES = ','.join([
+    'MEMBERINTERFACE=SIP/1001',
+    'MEMBERNAME=SIP/1001',
+    'QUEUENAME=sales',
+    'QUEUEPOSITION=3',
+    'DIALEDPEERNUMBER=1001@default',
+    'QUAKER_CALLED_NUMBER=6135551234',
+    'QUAKER_CALLER_ID=5b0a0b0c-4f5e-11e4-9e35-164230d1df67',
+    'QUAKER_CALLER_NAME=Alice Example',
+    'QUAKER_CALLER_NUMBER=6135550000',
+    'QUAKER_QUEUE_NAME=sales',
+    'QUAKER_QUEUE_NUMBER=100',
+])
+INTERFACE = 'SIP/1001@default'
+
+
+def get_quaker_vars(variables):
+    res = {}
+    for var in variables.split(','):
+        key, value = var.split('=', 1)
+        if key.startswith('QUAKER_'):
+            res[key[7:].lower()] = value
+
+    return res
+
+
+def get_member_number(data):
+    res = re.search('\d+(^@)?', data)
+
+    return res.group()
+
+
+def bench(name, func, arg, number):
+    best = min(timeit.repeat(lambda: func(arg), number=number, repeat=5))
+    usec = best / number * 1e6
+    print('%-24s %.2f usec/call' % (name, usec))
+
+    return usec
+
+
+def main():
+    assert get_quaker_vars(VARIABLES) == decoder.decode_variables(VARIABLES)
+    assert get_member_number(INTERFACE) == decoder.member_number(INTERFACE)
+
+    number = 100000
+    old = bench('split variables', get_quaker_vars, VARIABLES, number)
+    new = bench('decode_variables', decoder.decode_variables, VARIABLES,
+                number)
+    print('speedup: %.1fx' % (old / new))
+    old = bench('re.search member', get_member_number, INTERFACE, number)
+    new = bench('member_number', decoder.member_number, INTERFACE, number)
+    print('speedup: %.1fx' % (old / new))
+
+
+if __name__ == '__main__':
+    main()
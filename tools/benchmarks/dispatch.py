@@ -0,0 +1,65 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compare the serial event loop with keyed dispatch lanes.
+
+Every handler sleeps for --latency seconds to stand in for a cache round
+trip. Run with::
+
+    python tools/benchmarks/dispatch.py --events 2000 --callers 200
+"""
+
+import argparse
+import time
+
+from tornado import gen
+
+from quaker import dispatch
+
+
+def run(workers, events, callers, latency):
+    @gen.coroutine
+    def handler(data):
+        time.sleep(latency)
+
+    dispatcher = dispatch.Dispatcher(
+        workers=workers, size=events, overflow='block')
+    dispatcher.start()
+    start = time.time()
+    for i in range(events):
+        caller = 'caller-%d' % (i % callers)
+        dispatcher.put(handler, {'event': 'AgentCalled'}, key=caller)
+    dispatcher.join()
+    elapsed = time.time() - start
+    dispatcher.stop()
+
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--callers', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0005)
+    parser.add_argument('--workers', type=int, nargs='+', default=[4, 16])
+    args = parser.parse_args()
+
+    serial = run(1, args.events, args.callers, args.latency)
+    print('serial: %.3fs (%.0f events/s)' % (serial, args.events / serial))
+    for workers in args.workers:
+        elapsed = run(workers, args.events, args.callers, args.latency)
+        print('%d lanes: %.3fs (%.0f events/s, %.1fx)' % (
+            workers, elapsed, args.events / elapsed, serial / elapsed))
+
+
+if __name__ == '__main__':
+    main()
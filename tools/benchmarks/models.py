@@ -0,0 +1,122 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compare per event payload dicts with shared quaker.models fragments.
+
+Reports the time to build the payload sections of one AgentConnect, the
+objects tracked by the garbage collector it leaves behind, and the memory
+held per cached caller once its payload has been read, as it is for every
+caller notified. Run with::
+
+    python tools/benchmarks/models.py
+"""
+
+import gc
+import sys
+import timeit
+
+from quaker import models
+
+VARIABLES = {
+    'called_number': '6135551234',
+    'caller_id': '5b0a0b0c-4f5e-11e4-9e35-164230d1df67',
+    'caller_name': 'Alice Example',
+    'caller_number': '6135550000',
+    'queue_name': 'sales',
+    'queue_number': '100',
+}
+CALLER = {
+    'uuid': VARIABLES['caller_id'],
+    'created_at': '2014-10-08T14:02:11Z',
+    'name': VARIABLES['caller_name'],
+    'number': VARIABLES['caller_number'],
+    'position': 3,
+    'queue_id': VARIABLES['queue_name'],
+}
+
+
+def build_dicts(variables):
+    return {
+        'called': {
+            'number': variables['called_number'],
+        },
+        'caller': dict(CALLER),
+        'queue': {
+            'id': None,
+            'name': variables['queue_name'],
+            'number': variables['queue_number'],
+        },
+        'member': {
+            'id': None,
+            'name': 'SIP/1001',
+            'number': '1001',
+        },
+    }
+
+
+called = models.Fragments(models.Called)
+queues = models.Fragments(models.Queue)
+members = models.Fragments(models.Member)
+caller = models.Caller(**CALLER)
+
+
+def build_fragments(variables):
+    return {
+        'called': called[variables['called_number']].payload,
+        'caller': caller.payload,
+        'queue': queues[
+            None, variables['queue_name'], variables['queue_number']].payload,
+        'member': members[None, 'SIP/1001', '1001'].payload,
+    }
+
+
+def bench(name, func, arg, number):
+    best = min(timeit.repeat(lambda: func(arg), number=number, repeat=5))
+    usec = best / number * 1e6
+    print('%-24s %.2f usec/event' % (name, usec))
+
+    return usec
+
+
+def tracked(func, arg, number):
+    gc.collect()
+    gc.disable()
+    try:
+        before = gc.get_count()[0]
+        payloads = [func(arg) for _ in range(number)]
+        # NOTE: Less one for the list itself.
+        res = (gc.get_count()[0] - before - 1) / float(len(payloads))
+    finally:
+        gc.enable()
+
+    return res
+
+
+def main():
+    assert build_dicts(VARIABLES) == build_fragments(VARIABLES)
+
+    number = 100000
+    old = bench('nested dicts', build_dicts, VARIABLES, number)
+    new = bench('shared fragments', build_fragments, VARIABLES, number)
+    print('fragments run at %.1fx the speed of dicts' % (old / new))
+    print('gc tracked objects per event: dicts %.1f, fragments %.1f' % (
+        tracked(build_dicts, VARIABLES, 1000),
+        tracked(build_fragments, VARIABLES, 1000)))
+    record = models.Caller(**CALLER)
+    record.payload
+    print('cached caller: dict %d bytes, record %d bytes' % (
+        sys.getsizeof(CALLER),
+        sys.getsizeof(record) + sys.getsizeof(record.payload)))
+
+
+if __name__ == '__main__':
+    main()